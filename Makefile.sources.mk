@@ -2,6 +2,10 @@ PARSE_FILELIST := $(REPO_ROOT)/script/parse_filelist.py
 
 SOURCE_FILES ?= $(REPO_ROOT)/filelist/sources_sim.f
 
+# all modes in one call, as 'mode:token' words
+FILELIST := $(shell $(PARSE_FILELIST) all $(SOURCE_FILES))
+filelist_get = $(patsubst $(1):%,%,$(filter $(1):%,$(FILELIST)))
+
 # if SIM_ONLY, ignore getting sources so it doesn't trigger rebuilds
 SIM_ONLY ?= 0
 ifeq ($(strip $(SIM_ONLY)), 1)
@@ -11,18 +15,18 @@ INC_DIRS :=
 SRC_INC :=
 PLUS_INCDIR :=
 else
-SRC_DESIGN := $(shell $(PARSE_FILELIST) design $(SOURCE_FILES))
-SRC_VERIF := $(shell $(PARSE_FILELIST) verif $(SOURCE_FILES))
-INC_DIRS := $(shell $(PARSE_FILELIST) include-dirs $(SOURCE_FILES))
+SRC_DESIGN := $(call filelist_get,design)
+SRC_VERIF := $(call filelist_get,verif)
+INC_DIRS := $(call filelist_get,include-dirs)
 SRC_INC := $(foreach dir,$(INC_DIRS),$(dir)/*)
 PLUS_INCDIR := $(addprefix +incdir+,$(INC_DIRS))
 endif
 
-RTL_DEFINES_LIST := $(shell $(PARSE_FILELIST) defines $(SOURCE_FILES))
+RTL_DEFINES_LIST := $(call filelist_get,defines)
 # -D style defines for slang & verilator
 RTL_DEFINES_CS := $(addprefix -D,$(RTL_DEFINES_LIST))
 
-WORKLIB := $(shell $(PARSE_FILELIST) worklib $(SOURCE_FILES))
+WORKLIB := $(call filelist_get,worklib)
 
 # color coding
 GREEN  := $(shell printf "\033[0;32m")
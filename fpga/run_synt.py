@@ -7,17 +7,39 @@ under its own timestamped run dir
 
 strategy/defines/sources all come from YAML, see fpga/configs/_base.yaml
 
+configs that differ only in impl settings share one synthesis: it runs once
+into a shared run dir and each config's impl starts from its post_synt.dcp
+
+runs are admitted while their expected peak memory (from previous runs) fits
+the machine, longest expected first, with threads weighted by expected runtime
+
+--incremental_from starts synthesis and impl from a previous run's checkpoints
+(vivado incremental flows), unless that run's part, top or constraints differ,
+in which case it falls back to a full run
+
+sweeps expand one spec into many configs (cross product or random sample over
+dotted config keys) and prune points whose estimated post-synth WNS is
+hopeless before spending impl time on them, see fpga/configs/sweep_*.yaml
+
 Usage:
     ./run_synt.py --config fpga/configs/simd_full_50.yaml [more.yaml ...]
+    ./run_synt.py --sweep sweep.yaml
+    ./run_synt.py --config fpga/configs/simd.yaml --incremental_from synt_simd
 """
 
 import argparse
 import concurrent.futures
 import datetime
+import csv
+import hashlib
+import itertools
+import json
 import os
+import random
 import shutil
 import subprocess
 import sys
+import time
 
 import yaml
 
@@ -25,10 +47,31 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 REPO_ROOT = os.path.dirname(SCRIPT_DIR)
 sys.path.insert(0, REPO_ROOT)
 
+from script import artix_7_pll_config, parse_filelist, vivado_reports
 from script.utils import INDENT, print_runtime
 
-PARSE_FILELIST = os.path.join(REPO_ROOT, "script", "parse_filelist.py")
 SYNT_TCL = os.path.join(SCRIPT_DIR, "synt.tcl")
+# config keys that feed synth_design (xdcs are read before synthesis too)
+SYNT_KEYS = ("part", "sources", "defines", "hex_path", "synt")
+SYNT_DCP = "post_synt.dcp"
+SYNT_REPORTS = ("util_synt.rpt", "util_synt.hier.rpt",
+                "timing_summary_synt.max.rpt")
+# per-run peak memory/runtime, keyed by '<run name>:<stage>'
+HISTORY_FILE = os.path.join(REPO_ROOT, ".run_synt_history.json")
+RESOURCES_FILE = "resources.json" # next to console.log
+# incremental reference: routed checkpoint, and what it must match to be reused
+ROUTED_DCP = "routed.dcp"
+INCR_KEY_FILE = "incr_key.json"
+INCR_REUSE_RPT = "incr_reuse.rpt"
+DEFAULT_RSS_MB = 6000 # no history, typical Artix-7 impl
+DEFAULT_WALL_S = 1800
+MEM_HEADROOM = 0.9 # share of available memory given to vivado runs
+VIVADO_MAX_THREADS = 8 # no step uses more on Linux
+# board oscillator (MHz) and clock primitive, as in ama_riscv_fpga_clk_gen.sv
+BOARD_CLK = {
+    "BOARD_ARTY_A7": (100, "pll"),
+    "BOARD_CMOD_A7": (12, "mmcm"),
+}
 
 # config loading
 def deep_merge(base, over):
@@ -59,18 +102,83 @@ def load_config(path, _seen=None):
         cfg = deep_merge(base_cfg, cfg)
     return cfg
 
+def set_dotted(cfg, key, val):
+    """copy of cfg with cfg[a][b][c] = val for key 'a.b.c'"""
+    over = val
+    for part in reversed(key.split(".")):
+        over = {part: over}
+    return deep_merge(cfg, over)
+
+def solve_clk(cfg):
+    """copy of cfg with FPGA_* clock gen defines solved for its
+    CPU_TARGET_FREQ_MHZ, and the solved config"""
+    defines = cfg.get("defines") or {}
+    board = next((b for b in BOARD_CLK if defines.get(b)), None)
+    if board is None:
+        sys.exit(f"error: solve_clk: no board define ({', '.join(BOARD_CLK)})")
+    clkin, primitive = BOARD_CLK[board]
+    freq = defines["CPU_TARGET_FREQ_MHZ"]
+    c = artix_7_pll_config.best(clkin, [freq], primitive,
+                                artix_7_pll_config.speed_grade_of(cfg["part"]))
+    if c is None:
+        sys.exit(f"error: solve_clk: no {primitive} config for {freq}MHz")
+    return deep_merge(cfg, {"defines": {
+        "FPGA_DIVCLK_DIVIDE": c["divclk_divide"],
+        "FPGA_CLKFBOUT_MULT": f"{c['clkfbout_mult']:g}",
+        "FPGA_CLKOUT0_DIVIDE": f"{c['outputs'][0][0]:g}",
+    }}), c
+
+def expand_sweep(path):
+    """(sweep name, prune_wns, [(point name, cfg, {key: val})]) of a spec"""
+    spec = load_config(path) # resolves 'extends' into the base of all points
+    sweep = spec.pop("sweep", None) or {}
+    params = sweep.get("params") or {}
+    if not params:
+        sys.exit(f"error: sweep spec without 'sweep.params': {path}")
+    name = sweep.get("name") or os.path.splitext(os.path.basename(path))[0]
+    keys = list(params)
+    points = list(itertools.product(*(params[k] for k in keys)))
+    mode = sweep.get("mode", "product")
+    if mode == "random":
+        rng = random.Random(sweep.get("seed"))
+        points = rng.sample(points, min(sweep.get("samples", 1), len(points)))
+    elif mode != "product":
+        sys.exit(f"error: unknown sweep mode '{mode}': {path}")
+
+    out = []
+    for i, vals in enumerate(points):
+        cfg = dict(spec)
+        for k, v in zip(keys, vals):
+            cfg = set_dotted(cfg, k, v)
+        cfg["run_name"] = f"{name}_{i:03d}"
+        point = dict(zip(keys, vals))
+        if sweep.get("solve_clk"): # clock gen for any swept frequency
+            cfg, clk = solve_clk(cfg)
+            point["clk_mhz"] = round(clk["outputs"][0][1], 3)
+            point["vco_mhz"] = round(clk["vco_mhz"], 3)
+        out.append((cfg["run_name"], cfg, point))
+    return name, sweep.get("prune_wns"), out
+
+def mark_dominated(rows):
+    """flag points with another point at least as good in target frequency,
+    routed WNS and LUTs, and strictly better in one"""
+    done = [r for r in rows if r["wns"] is not None and r["luts"] is not None]
+    def key(r): # all maximized
+        return (r["freq_mhz"] or 0, r["wns"], -r["luts"])
+    for r in rows:
+        r["dominated"] = any(
+            all(a >= b for a, b in zip(key(o), key(r))) and key(o) != key(r)
+            for o in done
+        ) if r in done else None
+
 def resolve_path(p):
     return p if os.path.isabs(p) \
         else os.path.normpath(os.path.join(REPO_ROOT, p))
 
 # params.tcl
-def parse_filelist(mode, filelist):
-    env = dict(os.environ, REPO_ROOT=REPO_ROOT)
-    out = subprocess.run(
-        [sys.executable, PARSE_FILELIST, mode, filelist],
-        env=env, capture_output=True, text=True, check=True
-    )
-    return out.stdout.split()
+def parse_filelist_modes(filelist):
+    return parse_filelist.parse(
+        filelist, env=dict(os.environ, REPO_ROOT=REPO_ROOT))
 
 def build_defines(cfg):
     defs = []
@@ -104,12 +212,56 @@ def synt_options(synt):
 def tcl_list(items):
     return "{" + " ".join(items) + "}"
 
-def emit_params_tcl(cfg, run_dir, threads, elab_only=False):
-    filelist = resolve_path(cfg["sources"]["filelist"])
-    design = [resolve_path(p) for p in parse_filelist("design", filelist)]
+def synt_key(cfg):
+    """digest of the synthesis-relevant part of a resolved config"""
+    synt_cfg = {k: cfg.get(k) for k in SYNT_KEYS}
+    return hashlib.sha256(
+        json.dumps(synt_cfg, sort_keys=True).encode()).hexdigest()
+
+def incr_key(cfg):
+    """what a reference checkpoint has to match for incremental reuse"""
+    xdcs = {}
+    for p in cfg["sources"]["constraints"]:
+        rp = resolve_path(p)
+        try:
+            with open(rp, "rb") as f:
+                xdcs[p] = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            xdcs[p] = None
+    return {"part": cfg["part"], "top": cfg["sources"]["top"],
+            "constraints": xdcs}
+
+def incr_reference(ref_dir, cfg):
+    """(synt_dcp, routed_dcp, None) to start cfg from, or ("", "", reason) if
+    the reference run can't be reused"""
+    routed = os.path.join(ref_dir, ROUTED_DCP)
+    if not os.path.isfile(routed):
+        return "", "", f"no {ROUTED_DCP} in {ref_dir}"
+    key_path = os.path.join(ref_dir, INCR_KEY_FILE)
+    if not os.path.isfile(key_path):
+        return "", "", f"no {INCR_KEY_FILE} in {ref_dir}"
+    with open(key_path) as f:
+        ref = json.load(f)
+    cur = incr_key(cfg)
+    changed = [k for k in ("part", "top", "constraints") if ref[k] != cur[k]]
+    if changed:
+        return "", "", f"{', '.join(changed)} changed"
+    # synthesis reference: own or the shared one the impl started from
+    synt_dcp = os.path.join(ref_dir, SYNT_DCP)
+    if not os.path.isfile(synt_dcp):
+        synt_dcp = ref.get("synt_dcp") or ""
+    if synt_dcp and not os.path.isfile(synt_dcp):
+        synt_dcp = ""
+    return synt_dcp, routed, None
+
+def emit_params_tcl(cfg, run_dir, threads, elab_only=False,
+                    synt_only=False, synt_dcp="", incr_synt_dcp="",
+                    incr_impl_dcp=""):
+    fl = parse_filelist_modes(resolve_path(cfg["sources"]["filelist"]))
+    design = [resolve_path(p) for p in fl["design"]]
     headers = [p for p in design if p.endswith(".svh")]
     sources = [p for p in design if p.endswith(".sv")]
-    incdirs = [resolve_path(p) for p in parse_filelist("include-dirs",filelist)]
+    incdirs = [resolve_path(p) for p in fl["include-dirs"]]
     xdcs = [resolve_path(p) for p in cfg["sources"]["constraints"]]
 
     impl = cfg.get("impl") or {}
@@ -144,6 +296,10 @@ def emit_params_tcl(cfg, run_dir, threads, elab_only=False):
         f'set MMI {1 if cfg.get("mmi") else 0}',
         f'set MAX_THREADS {threads}',
         f'set ELAB_ONLY {1 if elab_only else 0}',
+        f'set SYNT_ONLY {1 if synt_only else 0}',
+        f'set SYNT_DCP "{synt_dcp}"',
+        f'set INCR_SYNT_DCP "{incr_synt_dcp}"',
+        f'set INCR_IMPL_DCP "{incr_impl_dcp}"',
     ]
     params = os.path.join(run_dir, "params.tcl")
     with open(params, "w") as f:
@@ -151,10 +307,44 @@ def emit_params_tcl(cfg, run_dir, threads, elab_only=False):
     return params
 
 # run
-def run_one(name, cfg, run_dir, threads, dry_run, elab_only=False):
+def run_vivado(cmd, run_dir, console):
+    """run cmd, returns (rc, resources) with peak RSS and CPU time of vivado
+    and its reaped children, also saved next to console.log"""
+    start = time.monotonic()
+    with open(console, "w") as out:
+        proc = subprocess.Popen(
+            cmd, cwd=run_dir, stdout=out, stderr=subprocess.STDOUT)
+        _, status, ru = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    res = {
+        "peak_rss_mb": round(ru.ru_maxrss / 1024), # kB on Linux
+        "cpu_s": round(ru.ru_utime + ru.ru_stime, 1),
+        "wall_s": round(time.monotonic() - start, 1),
+    }
+    with open(os.path.join(run_dir, RESOURCES_FILE), "w") as f:
+        json.dump(res, f, indent=4)
+    return proc.returncode, res
+
+def run_one(name, cfg, run_dir, threads, dry_run, elab_only=False,
+            synt_only=False, synt_dir=None, incr_from=None):
+    # synt_dir: shared synthesis run to start impl from, instead of synthesizing
+    # incr_from: previous run dir whose checkpoints guide synthesis and impl
     start_time = datetime.datetime.now()
     os.makedirs(run_dir, exist_ok=True)
-    params = emit_params_tcl(cfg, run_dir, threads, elab_only)
+    synt_dcp = os.path.join(synt_dir, SYNT_DCP) if synt_dir else ""
+    incr_synt_dcp, incr_impl_dcp = "", ""
+    if incr_from and not elab_only:
+        incr_synt_dcp, incr_impl_dcp, stale = incr_reference(incr_from, cfg)
+        if stale:
+            print(f"[INCR] {name}: not reusing {incr_from} ({stale}), " +
+                  "full run")
+        elif synt_dir: # already synthesized, only impl is incremental
+            incr_synt_dcp = ""
+        if synt_only:
+            incr_impl_dcp = ""
+    params = emit_params_tcl(
+        cfg, run_dir, threads, elab_only, synt_only, synt_dcp,
+        incr_synt_dcp, incr_impl_dcp)
     with open(os.path.join(run_dir, "config.resolved.yaml"), "w") as f:
         yaml.safe_dump(cfg, f, sort_keys=False)
     cmd = [
@@ -170,14 +360,37 @@ def run_one(name, cfg, run_dir, threads, dry_run, elab_only=False):
         print(f"Dry run for '{name}' completed.")
         return
 
+    if synt_dir: # keep synt reports next to the impl ones
+        for rpt in SYNT_REPORTS:
+            if os.path.isfile(os.path.join(synt_dir, rpt)):
+                shutil.copy2(os.path.join(synt_dir, rpt), run_dir)
+
+    key = incr_key(cfg)
+    key["synt_dcp"] = synt_dcp or os.path.join(run_dir, SYNT_DCP)
+    with open(os.path.join(run_dir, INCR_KEY_FILE), "w") as f:
+        json.dump(key, f, indent=4)
+
     console = os.path.join(run_dir, "console.log")
-    with open(console, "w") as out:
-        rc = subprocess.run(
-            cmd, cwd=run_dir, stdout=out, stderr=subprocess.STDOUT,
-        ).returncode
-    status_str = f"[{'OK' if rc == 0 else 'FAIL'}] {name} (rc={rc})"
+    rc, res = run_vivado(cmd, run_dir, console)
+    status_str = f"[{'OK' if rc == 0 else 'FAIL'}] {name} (rc={rc}, " + \
+        f"peak {res['peak_rss_mb']}MB, cpu {res['cpu_s']:.0f}s)"
     print_runtime(start_time, status_str)
 
+    # qor.json next to the reports, and a record in the cross-run QoR db
+    qor = vivado_reports.flatten(vivado_reports.write_run(
+        run_dir, name, rc, extra={
+            "resources": res,
+            "config": {k: cfg.get(k) for k in SYNT_KEYS + ("impl",)},
+            "incremental_from": incr_impl_dcp or incr_synt_dcp or None,
+        }))
+    if qor["wns"] is not None:
+        print(f"{INDENT}WNS {qor['wns']}ns, TNS {qor['tns']}ns, " +
+              (f"Fmax {qor['fmax_mhz']}MHz, " if qor["fmax_mhz"] else "") +
+              f"LUTs {qor['luts']}")
+    if qor["reuse_cells_pct"] is not None:
+        print(f"{INDENT}incremental: {qor['reuse_cells_pct']}% cells, " +
+              f"{qor['reuse_nets_pct']}% nets reused from {incr_impl_dcp}")
+
     # when vivado inevitably segfaults, print what happened
     if rc != 0:
         with open(console) as f:
@@ -192,14 +405,51 @@ def run_one(name, cfg, run_dir, threads, dry_run, elab_only=False):
 
     return rc
 
+# scheduling
+def load_history():
+    if not os.path.isfile(HISTORY_FILE):
+        return {}
+    try:
+        with open(HISTORY_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_history(hist):
+    tmp = f"{HISTORY_FILE}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(hist, f, indent=4, sort_keys=True)
+    os.replace(tmp, HISTORY_FILE)
+
+def mem_available_mb():
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except OSError:
+        pass
+    return None # unknown, don't limit on memory
+
+def pick_threads(run, est_wall, queued, free_cores, cores):
+    """share of the cores proportional to the run's expected runtime among
+    everything still to run, so the critical path gets the most threads"""
+    total = sum(est_wall(r) for r in queued) or 1
+    share = round(cores * est_wall(run) / total)
+    return max(1, min(VIVADO_MAX_THREADS, free_cores, share))
+
 def parse_args():
     parser = argparse.ArgumentParser(description="FPGA synt/impl driver (YAML configs)")
-    parser.add_argument("-c", "--config", nargs="+", required=True, help="One or more YAML configs")
-    parser.add_argument("-j", "--jobs", type=int, default=4, help="Number of oncurrent vivado processes")
-    parser.add_argument("--threads", type=int, default=0, help="Per-Vivado invokation max threads (general.maxThreads); 0 = vivado auto")
+    parser.add_argument("-c", "--config", nargs="+", default=[], help="One or more YAML configs")
+    parser.add_argument("--sweep", metavar="SPEC", help="YAML sweep spec (e.g. fpga/configs/sweep_simd_freq.yaml) expanded into one config per point. Points run like --config ones, each synthesized once so hopeless ones are pruned before impl, and a QoR summary CSV is written next to the run dirs")
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="Max number of concurrent vivado processes, fewer are started if their expected peak memory doesn't fit")
+    parser.add_argument("--threads", type=int, default=0, help="Per-Vivado invokation max threads (general.maxThreads); 0 = split the cores between runs, longest expected runs get more")
+    parser.add_argument("--mem_budget", type=float, default=0, metavar="GB", help=f"Memory vivado runs may use together; 0 = {MEM_HEADROOM * 100:.0f}%% of available memory at start")
     parser.add_argument("--date_tag", action='store_true', help="Append date tag to the end of the rundir name")
     parser.add_argument("--tag", type=str, help="Append provided tag to the end of the rundir name. Applied after --date_tag if used")
     parser.add_argument("--dry_run", action='store_true', default=False, help="Print configs that would run, generate 'config.resolved.yaml' and 'params.tcl', and exit")
+    parser.add_argument("--no_share_synt", action='store_true', default=False, help="Synthesize every config on its own, even if it differs from another only in impl settings")
+    parser.add_argument("--incremental_from", metavar="RUN_DIR", help=f"Previous run dir to start from: its {SYNT_DCP} guides incremental synthesis and its {ROUTED_DCP} incremental place and route. Falls back to a full run if the reference's part, top or constraints differ from the config's")
     parser.add_argument("--elab_only", action='store_true', default=False, help="Write a reusable RTL-elaboration Vivado project per config")
     return parser.parse_args()
 
@@ -209,10 +459,30 @@ def main():
     if not shutil.which("vivado"):
         sys.exit("error: vivado not on PATH (`source setup.sh` likely missing)")
 
+    if not args.config and not args.sweep:
+        sys.exit("error: nothing to run, use -c/--config and/or --sweep")
+    incr_from = None
+    if args.incremental_from:
+        incr_from = os.path.abspath(args.incremental_from)
+        if not os.path.isdir(incr_from):
+            sys.exit(f"error: not a directory: {args.incremental_from}")
+
     ts = datetime.datetime.now().strftime("%y%m%d-%H%M%S")
+    configs = [(cpath, load_config(cpath)) for cpath in args.config]
+    sweep_name, prune_wns, sweep_points = None, None, {}
+    if args.sweep:
+        sweep_name, prune_wns, points = expand_sweep(args.sweep)
+        print(f"sweep '{sweep_name}': {len(points)} point(s)" +
+              (f", pruning below {prune_wns}ns post-synth WNS"
+               if prune_wns is not None else ""))
+        for name, cfg, vals in points:
+            print(f"{INDENT}{name}: " +
+                  ", ".join(f"{k}={v}" for k, v in vals.items()))
+            configs.append((f"{args.sweep} [{name}]", cfg))
+            sweep_points[name] = vals
+
     jobs, names = [], {}
-    for cpath in args.config:
-        cfg = load_config(cpath)
+    for cpath, cfg in configs:
         name = \
             cfg.get("run_name") or os.path.splitext(os.path.basename(cpath))[0]
         if name in names:
@@ -226,32 +496,153 @@ def main():
         run_dir = os.path.join(run_root, f"synt_{name}{dtag_str}{utag_str}")
         jobs.append((name, cfg, run_dir))
 
-    print(f"launching {len(jobs)} run(s), up to {args.jobs} parallel "
-          f"({args.threads or 'auto'} threads each):")
+    # group by synthesis inputs; groups of 2+ synthesize once, shared
+    groups = {}
+    for job in jobs:
+        key = "" if args.elab_only or args.no_share_synt else synt_key(job[1])
+        groups.setdefault(key or job[0], []).append(job)
+    shared = {}
+    for key, members in groups.items():
+        # sweep points always synthesize separately, so they can be pruned
+        is_sweep = members[0][0] in sweep_points
+        if len(members) > 1 or (is_sweep and key != members[0][0]):
+            run_root = os.path.dirname(members[0][2])
+            shared[key] = os.path.join(
+                run_root, f"synt_shared_{key[:12]}{dtag_str}{utag_str}")
+
+    cores = os.cpu_count() or 1
+    mem_budget = args.mem_budget * 1024 if args.mem_budget \
+        else (mem_available_mb() or 0) * MEM_HEADROOM
+    print(f"launching {len(jobs)} run(s), up to {args.jobs} parallel, " +
+          (f"{mem_budget / 1024:.1f}GB memory budget, " if mem_budget else "") +
+          f"{args.threads or cores} threads" +
+          (" each:" if args.threads else " shared:"))
 
     for name, _, run_dir in jobs:
         print(f"{INDENT}{name} -> {run_dir}")
+    for key, synt_dir in shared.items():
+        print(f"{INDENT}shared synthesis for " +
+              ", ".join(name for name, _, _ in groups[key]) +
+              f" -> {synt_dir}")
+
+    # run: (name, cfg, run_dir, stage, run_one kwargs, shared group key)
+    pending = []
+    for key, members in groups.items():
+        if key in shared:
+            pending.append((os.path.basename(shared[key]), members[0][1],
+                            shared[key], "synt",
+                            {"synt_only": True, "incr_from": incr_from}, key))
+        else:
+            name, cfg, rd = members[0]
+            stage = "elab" if args.elab_only else "full"
+            pending.append((name, cfg, rd, stage, {
+                "elab_only": args.elab_only, "incr_from": incr_from}, None))
+
+    hist = load_history()
+    def hist_get(run, field, default):
+        return hist.get(f"{run[0]}:{run[3]}", {}).get(field, default)
+    def est_wall(run):
+        return hist_get(run, "wall_s", DEFAULT_WALL_S)
+    def est_rss(run):
+        return hist_get(run, "peak_rss_mb", DEFAULT_RSS_MB)
 
     start_time = datetime.datetime.now()
     results = {}
+    pruned = {} # name: post-synth WNS
+    running = {} # future: (run, threads)
     with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as ex:
-        fut = {
-            ex.submit(
-                run_one, name, cfg, rd, args.threads, args.dry_run,
-                args.elab_only): (name, rd)\
-                for name, cfg, rd in jobs
-        }
-        for f in concurrent.futures.as_completed(fut):
-            if args.dry_run:
-                continue
-            name, rd = fut[f]
-            rc = f.result()
-            results[name] = (rc, rd)
+        while pending or running:
+            # admit longest expected first while the memory estimate fits
+            pending.sort(key=est_wall, reverse=True)
+            for run in list(pending):
+                if len(running) >= args.jobs:
+                    break
+                used = sum(est_rss(r) for r, _ in running.values())
+                if running and mem_budget and \
+                used + est_rss(run) > mem_budget:
+                    continue
+                threads = args.threads or pick_threads(
+                    run, est_wall, pending + [r for r, _ in running.values()],
+                    cores - sum(t for _, t in running.values()), cores)
+                name, cfg, rd, stage, kw, _ = run
+                if not args.dry_run:
+                    print(f"{INDENT}start {name}: {threads} thread(s), " +
+                          f"~{est_rss(run)}MB expected")
+                f = ex.submit(run_one, name, cfg, rd, threads, args.dry_run,
+                              **kw)
+                running[f] = (run, threads)
+                pending.remove(run)
+
+            done, _ = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                run, _ = running.pop(f)
+                name, _, rd, stage, _, synt_of = run
+                rc = f.result()
+                if args.dry_run:
+                    rc = 0
+                elif os.path.isfile(os.path.join(rd, RESOURCES_FILE)):
+                    with open(os.path.join(rd, RESOURCES_FILE)) as rf:
+                        hist[f"{name}:{stage}"] = json.load(rf)
+                if synt_of is None:
+                    results[name] = (rc, rd)
+                    continue
+                # impl of a shared group is queued once its synthesis is done
+                wns = vivado_reports.parse_timing_summary(os.path.join(
+                    rd, "timing_summary_synt.max.rpt"))["wns"]
+                for m_name, m_cfg, m_rd in groups[synt_of]:
+                    if rc != 0:
+                        print(f"[SKIP] {m_name}: shared synthesis failed")
+                        results[m_name] = (rc, m_rd)
+                        continue
+                    if m_name in sweep_points and prune_wns is not None \
+                    and wns is not None and wns < prune_wns:
+                        print(f"[PRUNE] {m_name}: post-synth WNS {wns}ns")
+                        pruned[m_name] = wns
+                        results[m_name] = (0, m_rd)
+                        continue
+                    pending.append((m_name, m_cfg, m_rd, "impl", {
+                        "synt_dir": rd, "incr_from": incr_from}, None))
+
+    if not args.dry_run:
+        try:
+            save_history(hist)
+        except OSError as e:
+            print(f"warning: run history not saved: {e}")
 
     if args.dry_run:
         print(f"\nDry run completed. Exiting.")
         sys.exit(0)
 
+    if sweep_points:
+        rows = []
+        for name, vals in sweep_points.items():
+            rc, rd = results[name]
+            cfg = next(c for n, c, _ in jobs if n == name)
+            row = {"name": name, **vals, "freq_mhz":
+                   (cfg.get("defines") or {}).get("CPU_TARGET_FREQ_MHZ")}
+            row["status"] = "PRUNED" if name in pruned \
+                else "OK" if rc == 0 else "FAIL"
+            row.update(vivado_reports.flatten(vivado_reports.collect_run(rd)))
+            if name in pruned: # impl never ran, only the shared synt
+                row["wns_synt"] = pruned[name]
+            rows.append(row)
+        mark_dominated(rows)
+        run_root = os.path.dirname(results[rows[0]["name"]][1])
+        summary = os.path.join(
+            run_root, f"sweep_{sweep_name}{dtag_str}{utag_str}.csv")
+        with open(summary, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0]))
+            w.writeheader()
+            w.writerows(rows)
+        print(f"\nsweep '{sweep_name}' summary (non-dominated, best WNS first):")
+        best = sorted((r for r in rows if r["dominated"] is False),
+                      key=lambda r: -r["wns"])
+        for r in best:
+            print(f"{INDENT}{r['name']}: {r['freq_mhz']}MHz, " +
+                  f"WNS {r['wns']}ns, TNS {r['tns']}ns, {r['luts']:.0f} LUTs")
+        print(f"{INDENT}{len(pruned)} pruned, all points in {summary}")
+
     print_runtime(start_time, "All runs")
     sys.exit(0 if all(rc == 0 for rc, _ in results.values()) else 1)
 
@@ -44,25 +44,47 @@ if {$ELAB_ONLY} {
 }
 
 # ------------------------------------------------------------------------------
-# in-memory project + sources
-create_project -in_memory -part $PART
-set_fileset_cfg $DEFINES $INCLUDE_DIRS
-load_headers $HEADERS read_verilog
-read_verilog -library xil_defaultlib -sv $SOURCES
-foreach xdc $XDCS { read_xdc $xdc }
+# impl from a synthesis shared with other configs: checkpoint carries the xdcs
+if {$SYNT_DCP ne ""} {
+    puts "INFO: starting from shared synthesis $SYNT_DCP"
+    open_checkpoint $SYNT_DCP
+} else {
+    # --------------------------------------------------------------------------
+    # in-memory project + sources
+    create_project -in_memory -part $PART
+    set_fileset_cfg $DEFINES $INCLUDE_DIRS
+    load_headers $HEADERS read_verilog
+    read_verilog -library xil_defaultlib -sv $SOURCES
+    foreach xdc $XDCS { read_xdc $xdc }
+
+    # --------------------------------------------------------------------------
+    # synthesis
+    # incremental: unchanged partitions of the reference netlist are reused
+    set synth_incr ""
+    if {$INCR_SYNT_DCP ne ""} {
+        puts "INFO: incremental synthesis from $INCR_SYNT_DCP"
+        read_checkpoint -incremental $INCR_SYNT_DCP
+        set synth_incr "-incremental_mode default"
+    }
+    set synth_cmd "synth_design -top $TOP -part $PART \
+        -flatten_hierarchy $SYNTH_FLATTEN \
+        -directive $SYNTH_DIRECTIVE $SYNTH_OPTIONS $synth_incr"
+    puts "INFO: $synth_cmd"
+    eval $synth_cmd
+
+    report_utilization -file $RUN_DIR/util_synt.rpt
+    report_utilization -hierarchical -hierarchical_percentages \
+        -file $RUN_DIR/util_synt.hier.rpt
+    # estimated, lets sweeps prune hopeless points before impl
+    report_timing_summary -delay_type max -max_paths 10 \
+        -file $RUN_DIR/timing_summary_synt.max.rpt
+    write_checkpoint -force $RUN_DIR/post_synt.dcp
+}
 
-# ------------------------------------------------------------------------------
-# synthesis
-set synth_cmd "synth_design -top $TOP -part $PART \
-    -flatten_hierarchy $SYNTH_FLATTEN \
-    -directive $SYNTH_DIRECTIVE $SYNTH_OPTIONS"
-puts "INFO: $synth_cmd"
-eval $synth_cmd
-
-report_utilization -file $RUN_DIR/util_synt.rpt
-report_utilization -hierarchical -hierarchical_percentages \
-    -file $RUN_DIR/util_synt.hier.rpt
-write_checkpoint -force $RUN_DIR/post_synt.dcp
+if {$SYNT_ONLY} {
+    puts "Synthesis runtime: [expr {[clock seconds] - $start}]s"
+    return
+}
 
 # ------------------------------------------------------------------------------
 # implementation
@@ -70,6 +92,12 @@ write_checkpoint -force $RUN_DIR/post_synt.dcp
 # power steps (enable-only, no -directive) run only if enabled
 if {$IMPL_OPT_DIRECTIVE ne ""} { opt_design -directive $IMPL_OPT_DIRECTIVE }
 if {$IMPL_POWER_OPT_ENABLE} { power_opt_design }
+# incremental: placement and routing of matching cells/nets are taken from the
+# reference, only the changed logic is placed and routed
+if {$INCR_IMPL_DCP ne ""} {
+    puts "INFO: incremental implementation from $INCR_IMPL_DCP"
+    read_checkpoint -incremental $INCR_IMPL_DCP
+}
 if {$IMPL_PLACE_DIRECTIVE ne ""} { place_design -directive $IMPL_PLACE_DIRECTIVE }
 if {$IMPL_POST_PLACE_POWER_OPT_ENABLE} { power_opt_design }
 foreach d $IMPL_PHYS_OPT_DIRECTIVES { phys_opt_design -directive $d }
@@ -88,6 +116,9 @@ report_timing_summary -delay_type min {*}$timing_cfg \
 report_timing_summary -delay_type max {*}$timing_cfg \
     -file $RUN_DIR/timing_summary_routed.max.rpt
 report_power -file $RUN_DIR/power_routed.rpt
+if {$INCR_IMPL_DCP ne ""} {
+    report_incremental_reuse -file $RUN_DIR/incr_reuse.rpt
+}
 write_checkpoint -force $RUN_DIR/routed.dcp
 
 set DESIGN_NAME "ama_riscv_fpga"
@@ -2,6 +2,7 @@
 
 import argparse
 import datetime
+import fnmatch
 import functools
 import glob
 import os
@@ -13,13 +14,16 @@ import signal
 import subprocess
 import sys
 import time
-from dataclasses import dataclass
-from multiprocessing import Manager, Pool
+from dataclasses import asdict, dataclass
+from multiprocessing import Event, Pool, Value
 
 from ruamel.yaml import YAML
 
+from script import (build_cache, dist_queue, perf_gate, run_history,
+                    run_results)
 from script.utils import (CC_GREEN, CC_RED, CC_YELLOW, INDENT,
-                          color_code_string, print_runtime)
+                          color_code_string, format_bytes, get_dir_size,
+                          print_runtime)
 
 TEST_LOG = "test.log"
 REPO_ROOT = os.getenv("REPO_ROOT") \
@@ -29,12 +33,36 @@ MAX_WORKERS = int(os.cpu_count())
 TEST_STATUS = "test.status"
 TOUCHFILE_COV = ".cov.touchfile"
 BUILD_LINKS = ["Makefile", "Makefile.sources.mk", "cosim"]
+SOURCE_FILES = os.getenv("SOURCE_FILES") \
+    or os.path.join(REPO_ROOT, "filelist", "sources_sim.f")
+COSIM_SO = os.path.join(
+    REPO_ROOT, "cosim", "build_runtest", "ama-riscv-cosim.so")
+# written by xsim at runtime inside the snapshot, so never linked into test dirs
+SNAPSHOT_RW = ["xsimkernel.log", "xsimcrash.log", "webtalk"]
+# per-test coverage DB seeded at elab and populated by each test
+COV_DB = "xsim.codeCov"
+# test.log lines that already decide a failing test (cosim checker mismatch,
+# tohost checker, tb timeout), watched while the simulation runs with -s
+FAIL_LINE_RE = re.compile(
+    r"^.*(ERROR: Mismatch @|'tohost' failed #|ERROR: Test timed out).*$",
+    re.MULTILINE)
+LOG_POLL_S = 0.2
+RUN_HISTORY = os.path.join(REPO_ROOT, run_history.HISTORY_FILE)
+DIST_QUEUE = "dist_queue" # inside the run dir, shared with worker hosts
+PERF_BASELINE = os.path.join(REPO_ROOT, "perf_baseline.json")
 
 yaml = YAML()
 yaml.preserve_quotes = True
 yaml.indent(mapping=2, sequence=4, offset=2)
 
 BUNDLES_KEY = "_bundles"
+# {dir: (st_mtime_ns, {name: is_dir})}, listings reused while dir is unchanged
+_dir_cache = {}
+
+# shared with pool workers through _init_worker, not a Manager server process
+_test_cnt = None # multiprocessing.Value, tests started so far
+_stop = None # multiprocessing.Event, set on first failure with stop_on_fail
+_total = 0
 
 @dataclass
 class make_args:
@@ -72,6 +100,44 @@ def create_run_cfg(log_wave, log_vcd):
     with open(RUN_CFG, 'w') as file:
         file.writelines(line + '\n' for line in tcl_content)
 
+def list_dir_cached(path):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    hit = _dir_cache.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    with os.scandir(path) as it:
+        entries = {e.name: e.is_dir() for e in it}
+    _dir_cache[path] = (mtime, entries)
+    return entries
+
+def glob_cached(pattern):
+    # glob.glob() equivalent that lists each directory once, so thousands of
+    # testlist entries in the same few dirs don't re-read them per entry
+    parts = os.path.normpath(pattern).split(os.sep)
+    magic = [glob.has_magic(part) for part in parts]
+    if not any(magic):
+        return [pattern] if os.path.exists(pattern) else []
+
+    first = magic.index(True)
+    paths = [os.sep.join(parts[:first]) or os.sep]
+    for i in range(first, len(parts)):
+        part, last = parts[i], i == len(parts) - 1
+        matched = []
+        for base in paths:
+            entries = list_dir_cached(base)
+            if magic[i]: # hidden entries only on explicit '.', as glob does
+                names = [n for n in fnmatch.filter(entries, part)
+                         if not n.startswith('.') or part.startswith('.')]
+            else:
+                names = [part] if part in entries else []
+            matched.extend(os.path.join(base, n) for n in names
+                           if last or entries[n])
+        paths = matched
+    return paths
+
 def find_all_tests(test_list, filters=None):
     # if filtering is used, apply on top level keys, and put only those entires
     # otherwise, just flatten the entire test_list
@@ -90,32 +156,32 @@ def find_all_tests(test_list, filters=None):
         for bundled_filter in bundles.get(f, [f])
     ]
 
-    tl_flat = [item for sublist in test_list.values() for item in sublist]
+    # entries as (path, pattern) tuples, so include/exclude are set lookups
+    tl_flat = [tuple(item) for sublist in test_list.values() for item in sublist]
     tl_filt = tl_flat
     if filters:
         tl_filt = [] # reset, filled after filtering
         mode = "neg" if all(f.startswith('~') for f in filters) else "pos"
 
-        tl = {"inc" : [], "exc" : []}
+        tl = {"inc" : set(), "exc" : set()}
+        compiled = [
+            ("exc", re.compile(f[1:])) if f.startswith('~')
+            else ("inc", re.compile(f))
+            for f in filters
+        ]
         for key in test_list:
-            for f in filters:
-                idx = "inc"
-                if f.startswith('~'):
-                    f = f[1:]
-                    idx = "exc"
-                if re.search(f, key):
-                    tl[idx].extend(test_list[key])
+            for idx, f_re in compiled:
+                if f_re.search(key):
+                    tl[idx].update(tuple(item) for item in test_list[key])
 
         if mode == "pos":
             # include all from inc, and remove items from exc
             if len(tl["inc"]) > 0:
-                tl_filt_all = [
-                    item for item in tl_flat
-                    if (item in tl["inc"]) and (item not in tl["exc"])
-                ]
-                # go through list and add only unique items to tl_filt
-                for item in tl_filt_all:
-                    if item not in tl_filt:
+                seen = set() # add only unique items to tl_filt, keep order
+                for item in tl_flat:
+                    if item in tl["inc"] and item not in tl["exc"] \
+                    and item not in seen:
+                        seen.add(item)
                         tl_filt.append(item)
         else:
             # exclude from all those in exc, no inc list
@@ -125,7 +191,7 @@ def find_all_tests(test_list, filters=None):
     some_mismatched = False
     for path, test_name_pattern in tl_filt:
         full_pattern = os.path.join(REPO_ROOT, path, test_name_pattern)
-        matched_files = glob.glob(full_pattern)
+        matched_files = glob_cached(full_pattern)
         if matched_files:
             for file in matched_files:
                 valid_tests.append(file)
@@ -158,21 +224,26 @@ def get_paths_for_test(run_dir, test_name):
     p['status_file'] = os.path.join(p['test_dir'], TEST_STATUS)
     return p
 
-def check_test_status(status_file, test_log_path):
+def read_status_file(status_file):
+    # convert testbench written status to dict, None if not written
     if not os.path.exists(status_file):
+        return None
+    status = {}
+    with open(status_file, 'r') as f:
+        for line in f:
+            key, sep, val = line.strip().partition("=")
+            if sep:
+                status[key] = val
+    return status
+
+def check_test_status(status_file, test_log_path, status=None):
+    # status: already parsed status_file, read here if not given
+    if status is None:
+        status = read_status_file(status_file)
+    if status is None:
         return False, f"{TEST_STATUS} not found. Check {test_log_path} " + \
             "for simulator/tool failure details."
 
-    def read_status_file(status_file):
-        # convert testbench written status to dict
-        status = {}
-        with open(status_file, 'r') as f:
-            for line in f:
-                key, sep, val = line.strip().partition("=")
-                if sep:
-                    status[key] = val
-        return status
-
     def format_status_msg(status):
         # parse dict for relevant fields and check values
         msg = status.get("reason", "")
@@ -185,7 +256,6 @@ def check_test_status(status_file, test_log_path):
                 if msg else f"errors={status['errors']}"
         return "" if msg == "none" else msg
 
-    status = read_status_file(status_file)
     if status.get("status") == "PASSED":
         return True, ""
     if status.get("status") == "FAILED":
@@ -193,6 +263,25 @@ def check_test_status(status_file, test_log_path):
     return False, f"Invalid status in {status_file}: " + \
         f"{status.get('status', '<missing>')}"
 
+def scan_log_for_failure(log_path, state):
+    # reads what was appended to log_path since the last call, returns the
+    # first failure line or None. state: {'pos': offset, 'rest': partial line}
+    try:
+        with open(log_path, 'rb') as f:
+            f.seek(state['pos'])
+            data = f.read()
+    except FileNotFoundError: # make hasn't started xsim yet
+        return None
+    state['pos'] += len(data)
+    text, _, state['rest'] = \
+        (state['rest'] + data.decode(errors='replace')).rpartition('\n')
+    m = FAIL_LINE_RE.search(text)
+    return m.group(0).strip() if m else None
+
+def _init_worker(test_cnt, stop, total):
+    global _test_cnt, _stop, _total
+    _test_cnt, _stop, _total = test_cnt, stop, total
+
 # main functions
 def set_up_links(dest_dir, source_names):
     for s in source_names:
@@ -201,12 +290,73 @@ def set_up_links(dest_dir, source_names):
         if not os.path.exists(linked_path):
             os.symlink(path, linked_path)
 
-def build_tb(build_dir, force_rebuild, coverage=False):
+def populate_test_dir(build_dir, test_dir, link_build=False):
+    # returns (bytes copied, bytes linked) so the saving is visible per test
+    if not link_build:
+        shutil.copytree(build_dir, test_dir, symlinks=True)
+        return get_dir_size(test_dir), 0
+
+    # overlay-style: real dirs, read-only snapshot files hardlinked from the
+    # build, copies only for top-level touchfiles/logs, the files xsim writes
+    # and the coverage DB. Hardlinks (not symlinks) keep xsimk resolving its
+    # own snapshot dir to the test dir
+    copied, linked = 0, 0
+    for root, dirs, files in os.walk(build_dir):
+        rel = os.path.relpath(root, build_dir)
+        dst_root = os.path.normpath(os.path.join(test_dir, rel))
+        os.makedirs(dst_root, exist_ok=True)
+        for d in list(dirs):
+            src, dst = os.path.join(root, d), os.path.join(dst_root, d)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+            elif d in SNAPSHOT_RW or (rel == "." and d == COV_DB):
+                shutil.copytree(src, dst, symlinks=True)
+                copied += get_dir_size(dst)
+            else:
+                continue
+            dirs.remove(d)
+
+        for f in files:
+            src, dst = os.path.join(root, f), os.path.join(dst_root, f)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+                continue
+            size = os.path.getsize(src)
+            if rel != "." and f not in SNAPSHOT_RW:
+                try:
+                    os.link(src, dst)
+                    linked += size
+                    continue
+                except OSError: # e.g. cross-device, fall back to a copy
+                    pass
+            shutil.copy2(src, dst)
+            copied += size
+    return copied, linked
+
+def build_tb(build_dir, force_rebuild, coverage=False,
+             cache_dir=None, cache_size_gb=0):
     if os.path.exists(build_dir):
         shutil.rmtree(build_dir)
     os.makedirs(build_dir)
 
     set_up_links(build_dir, BUILD_LINKS)
+
+    # identifies the snapshot for incremental runs, with or without a cache
+    key = build_cache.build_key(
+        REPO_ROOT, os.getcwd(), SOURCE_FILES, coverage)
+    if cache_dir:
+        # -b always elaborates from scratch, result still refreshes the cache
+        entry = None if force_rebuild else build_cache.lookup(cache_dir, key)
+        if entry:
+            print(f"Restoring build {key[:12]} from cache '{cache_dir}'... ",
+                  end='', flush=True)
+            start_time = datetime.datetime.now()
+            build_cache.restore(entry, build_dir, BUILD_LINKS, COSIM_SO)
+            build_cache.write_build_key(build_dir, key)
+            print_runtime(start_time, "Restore done,")
+            return
+        print(f"Build {key[:12]} not in cache '{cache_dir}'")
+
     print(f"Building in {build_dir}... ", end='', flush=True)
     start_time = datetime.datetime.now()
     make_cmd = [
@@ -239,27 +389,39 @@ def build_tb(build_dir, force_rebuild, coverage=False):
     if coverage: # marker so reused builds can be checked for instrumentation
         open(os.path.join(build_dir, TOUCHFILE_COV), 'w').close()
 
+    build_cache.write_build_key(build_dir, key)
     print_runtime(start_time, "Build done,")
 
+    if cache_dir:
+        build_cache.store(cache_dir, key, build_dir, BUILD_LINKS, COSIM_SO,
+                          replace=force_rebuild)
+        evicted = build_cache.evict(
+            cache_dir, int(cache_size_gb * 1024**3), keep=key)
+        if evicted:
+            print(f"Evicted {len(evicted)} build(s) from cache to stay " +
+                  f"under {cache_size_gb}GB")
+
 def run_test(
-    test_path, run_dir, build_dir, make_args, mgr,
-    keep_pass=False, stop_on_fail=False
-    ) -> None:
+    test_path, run_dir, build_dir, make_args,
+    keep_pass=False, stop_on_fail=False, link_build=False, wall_budget=None,
+    suite=None
+    ):
+    # returns the test's run_results record, None if skipped
+    # wall_budget: seconds after which the simulation is assumed hung and killed
+    # suite: run_results.new_suite_id() of the suite, stored in the record
 
     start_time = datetime.datetime.now()
     test_name = format_test_name(test_path)
     test_path_make = os.path.splitext(test_path)[0]
 
-    if stop_on_fail and mgr["stop"].is_set():
+    if stop_on_fail and _stop.is_set():
         print(f"Skipping test '{test_name}' (stop_on_fail).")
-        return
+        return None
 
-    with mgr["lock"]:
-        mgr["test_cnt"].value += 1
-        print(
-            f"Running test {mgr['test_cnt'].value}/{mgr['all_tests']}: " \
-            f"'{test_name}'"
-        )
+    with _test_cnt.get_lock():
+        _test_cnt.value += 1
+        test_idx = _test_cnt.value
+    print(f"Running test {test_idx}/{_total}: '{test_name}'")
 
     p = get_paths_for_test(run_dir, test_name)
     if os.path.exists(p['test_dir']):
@@ -270,10 +432,10 @@ def run_test(
                     if "PASSED" in status:
                         print(f"Test '{test_name}' already passed.",
                               color_code_string("Skipping", CC_YELLOW))
-                        return
+                        return None
         shutil.rmtree(p['test_dir'])
 
-    shutil.copytree(build_dir, p['test_dir'], symlinks=True)
+    copied, linked = populate_test_dir(build_dir, p['test_dir'], link_build)
     make_cmd = [
         "make", "sim",
         "ISA_SIM_BDIR=build_obj_runtest",
@@ -306,75 +468,181 @@ def run_test(
         start_new_session=True
     )
 
-    # on SIGTERM (sent by pool.terminate() on Ctrl+C), kill whole process group
-    # so simulator orphans don't keep running after the pool workers are gone
-    def _sigterm_handler(sig, frame):
+    def kill_proc_group():
         try:
             os.killpg(proc.pid, signal.SIGKILL)
         except ProcessLookupError:
             pass
+
+    # on SIGTERM (sent by pool.terminate() on Ctrl+C), kill whole process group
+    # so simulator orphans don't keep running after the pool workers are gone
+    def _sigterm_handler(sig, frame):
+        kill_proc_group()
         sys.exit(1)
 
     old_handler = signal.signal(signal.SIGTERM, _sigterm_handler)
+    timed_out = False
+    early_fail = None
+    deadline = time.monotonic() + wall_budget if wall_budget else None
+    log_state = {'pos': 0, 'rest': ""}
     try:
-        proc.wait()
+        while True:
+            # without -s nothing to react to, just wait for exit or watchdog
+            poll_s = LOG_POLL_S if stop_on_fail else None
+            if deadline:
+                left = max(0, deadline - time.monotonic())
+                poll_s = min(poll_s, left) if poll_s else left
+            try:
+                proc.wait(timeout=poll_s)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if deadline and time.monotonic() >= deadline:
+                # hung before reaching TIMEOUT_CLOCKS, free the slot now
+                timed_out = True
+                kill_proc_group()
+                proc.wait()
+                break
+            early_fail = scan_log_for_failure(p['test_log'], log_state)
+            if early_fail:
+                # suite stops anyway, don't wait for teardown and wave flush
+                kill_proc_group()
+                proc.wait()
+                break
     finally:
         signal.signal(signal.SIGTERM, old_handler) # restore for next iteration
 
     print(f"Test '{test_name}' DONE.", end=" ")
-    passed, msg = check_test_status(p['status_file'], p['test_log'])
+    tb_status = read_status_file(p['status_file'])
+    passed, msg = check_test_status(
+        p['status_file'], p['test_log'], tb_status)
     if proc.returncode != 0 and passed:
         passed = False
         msg = f"make/simulator failed with exit code {proc.returncode}."
+    if timed_out:
+        passed = False
+        msg = f"Killed by wall-clock watchdog after {wall_budget}s."
+    elif early_fail and tb_status is None: # killed before writing status
+        passed = False
+        msg = f"Killed early on log line: {early_fail}"
 
     status_str, cc = ("PASSED", CC_GREEN) if passed else ("FAILED", CC_RED)
+    if timed_out:
+        status_str, cc = run_results.TIMEOUT, CC_YELLOW
     print(color_code_string(status_str, cc), end=' ')
+    print(f"[build: {format_bytes(copied)} copied" +
+          (f", {format_bytes(linked)} linked]" if link_build else "]"),
+          end=' ')
     print_runtime(start_time)
     if msg:
         print(msg.strip())
 
     if not passed and stop_on_fail:
-        mgr["stop"].set()
-        raise ValueError(f"Test '{test_name}' failed. Stopping.")
+        _stop.set() # parent terminates the pool once it sees the result
+    status = run_results.PASSED if passed \
+        else run_results.TIMEOUT if timed_out \
+        else run_results.FAILED if tb_status is not None or early_fail \
+        else run_results.ERROR
+    return run_results.make_record(
+        test_path, test_name, status, msg.strip(),
+        (datetime.datetime.now() - start_time).total_seconds(),
+        proc.returncode, tb_status, suite)
+
+def run_test_chunk(test_paths, wall_budgets=None, **kwargs):
+    # one pool task may carry several short tests, see run_history.schedule
+    return [
+        (t, run_test(t, wall_budget=(wall_budgets or {}).get(t), **kwargs))
+        for t in test_paths
+    ]
 
-def run_suite(all_tests, run_dir, build_dir, ma, jobs, keep_pass, stop_on_fail):
+def run_suite(all_tests, run_dir, build_dir, ma, jobs, keep_pass, stop_on_fail,
+              link_build=False, history=RUN_HISTORY, inputs=None,
+              dist=False, dist_local=0, watchdog=0, mode="", suite=None):
+    # inputs: {test_path: run_results.test_inputs}, stored with each record
+    # mode: run_history.sim_mode, history of slower instrumented runs is apart
+    # dist: queue tests for run_worker processes, jobs is then the total number
+    # of worker slots across hosts and only used for the runtime estimate
     if jobs < 1:
         raise ValueError("The number of parallel jobs must be at least 1.")
-    if jobs > MAX_WORKERS:
+    if jobs > MAX_WORKERS and not dist:
         print(f"Warning: The specified number of jobs ({jobs}) exceeds the " +
               f"number of available CPU cores ({MAX_WORKERS}).")
-    w = min(jobs, MAX_WORKERS)
-    print(f"Running simulation with {w} workers\n")
+    w = jobs if dist else min(jobs, MAX_WORKERS)
+
+    # longest expected first, so long tests don't end up as the suite's tail
+    hist = run_history.load(history)
+    est, known = run_history.expected_runtimes(
+        all_tests, hist, REPO_ROOT,
+        lambda t: get_paths_for_test(run_dir, format_test_name(t))['test_log'],
+        mode)
+    tasks = run_history.schedule(all_tests, est, w)
+    makespan = run_history.estimate_makespan(tasks, est, w)
+    print(f"Runtime history for {known}/{len(all_tests)} test(s), " +
+          f"{len(tasks)} task(s), estimated simulation runtime: " +
+          f"{datetime.timedelta(seconds=round(makespan))}")
+    if dist:
+        print(f"Distributing simulation over workers, {w} slots expected\n")
+    else:
+        print(f"Running simulation with {w} workers\n")
+    wall_budgets = run_history.watchdog_budgets(
+        all_tests, hist, REPO_ROOT, ma.timeout_clocks, watchdog, mode)
+    if watchdog > 0:
+        n_budget = sum(1 for b in wall_budgets.values() if b)
+        print(f"Wall-clock watchdog armed for {n_budget}/{len(all_tests)} " +
+              "test(s)")
+    runtimes, cycles = {}, {}
+    tally = {True: 0, False: 0, None: 0} # passed, failed, skipped
+
+    def progress():
+        print(f"Progress: {sum(tally.values())}/{len(all_tests)} done, " +
+              color_code_string(f"{tally[True]} passed", CC_GREEN) + ", " +
+              color_code_string(f"{tally[False]} failed",
+                                CC_RED if tally[False] else CC_GREEN) +
+              (f", {tally[None]} skipped" if tally[None] else ""))
+
+    def collect(records, skipped=0):
+        # skipped: tasks that returned no record (-p already passed, -s stop)
+        for rec in records:
+            rec["inputs"] = (inputs or {}).get(rec["path"])
+        run_results.append(run_dir, records)
+        if skipped:
+            tally[None] += skipped
+            progress()
+        for rec in records:
+            passed = rec["status"] == run_results.PASSED
+            if passed: # failed, killed or timed out runs are cut short
+                runtimes[rec["path"]] = rec["wall_s"]
+                cycles[rec["path"]] = rec["cycles"]
+            tally[passed] += 1
+            progress()
+            if not passed and stop_on_fail:
+                raise ValueError(f"Test '{rec['test']}' failed. Stopping.")
 
     #random.seed(5)
     #sv_seed = args.seed if args.seed is not None \
     #          else random.randint(0, 2**32 - 1)
     # run tests in parallel
     start_time = datetime.datetime.now()
+    run_kwargs = dict(run_dir=run_dir, build_dir=build_dir, make_args=ma,
+                      keep_pass=keep_pass, stop_on_fail=stop_on_fail,
+                      link_build=link_build, suite=suite)
     try:
-        with Manager() as manager:
-            mgr = manager.dict()
-            mgr["test_cnt"] = manager.Value('i', 0)
-            mgr["lock"] = manager.Lock()
-            mgr["all_tests"] = len(all_tests)
-            mgr["stop"] = manager.Event()
-            with Pool(w) as pool:
+        if dist:
+            run_dist([t for task in tasks for t in task], run_kwargs, collect,
+                     dist_local, wall_budgets)
+        else:
+            init_args = (Value('i', 0), Event(), len(all_tests))
+            with Pool(w, initializer=_init_worker, initargs=init_args) as pool:
                 partial_run_test = \
-                    functools.partial(
-                        run_test,
-                        run_dir=run_dir,
-                        build_dir=build_dir,
-                        make_args=ma,
-                        mgr=mgr,
-                        keep_pass=keep_pass,
-                        stop_on_fail=stop_on_fail
-                    )
+                    functools.partial(run_test_chunk,
+                                      wall_budgets=wall_budgets, **run_kwargs)
                 # imap_unordered yields results as workers finish, so the main
-                # process can react to the first failure immediately rather than
-                # waiting for all tasks to complete (pool.map behavior)
+                # process can react to the first failure immediately rather
+                # than waiting for all tasks to complete (pool.map behavior)
                 try:
-                    for _ in pool.imap_unordered(partial_run_test, all_tests):
-                        pass
+                    for res in pool.imap_unordered(partial_run_test, tasks):
+                        collect([rec for _, rec in res if rec is not None],
+                                sum(1 for _, rec in res if rec is None))
                 except Exception:
                     if stop_on_fail:
                         # terminate sends SIGTERM to workers; _sigterm_handler
@@ -388,8 +656,104 @@ def run_suite(all_tests, run_dir, build_dir, ma, jobs, keep_pass, stop_on_fail):
     except Exception as e:
         print(f"Error during test execution: {e}")
 
+    try:
+        run_history.update(history, runtimes, REPO_ROOT, cycles, mode)
+    except OSError as e:
+        print(f"Warning: runtime history not updated: {e}")
     print_runtime(start_time, "Simulation")
 
+def run_dist(ordered_tests, run_kwargs, collect, dist_local=0,
+             wall_budgets=None):
+    # coordinator: queue one job per test in the run dir, then collect records
+    # written back by run_worker processes on any host sharing the filesystem
+    run_dir = os.path.abspath(run_kwargs['run_dir'])
+    qdir = os.path.join(run_dir, DIST_QUEUE)
+    job_args = dict(run_kwargs, run_dir=run_dir,
+                    build_dir=os.path.abspath(run_kwargs['build_dir']),
+                    make_args=asdict(run_kwargs['make_args']))
+    dist_queue.init(qdir)
+    pending = set(dist_queue.submit(qdir, [
+        dict(job_args, name=format_test_name(t), test_path=t,
+             total=len(ordered_tests),
+             wall_budget=(wall_budgets or {}).get(t))
+        for t in ordered_tests
+    ]))
+    print(f"Queued {len(pending)} test(s) in '{qdir}'. Start workers with:")
+    print(f"{INDENT}{os.path.abspath(__file__)} --worker {qdir} -j <N>\n")
+
+    local = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__),
+                          "--worker", qdir, "-j", "1"])
+        for _ in range(dist_local)
+    ]
+    seen, last_check, warned = set(), time.time(), False
+    try:
+        while pending:
+            done = dist_queue.collect(qdir, seen)
+            pending.difference_update(job_id for job_id, _ in done)
+            collect([res["record"] for _, res in done if res.get("record")],
+                    sum(1 for _, res in done if not res.get("record")))
+            if time.time() - last_check > dist_queue.POLL_S * 10:
+                last_check = time.time()
+                for job_id in dist_queue.requeue_stale(qdir):
+                    print(f"Requeued '{job_id}', its worker stopped responding")
+                if not dist_queue.workers(qdir) and not warned:
+                    warned = True
+                    print(color_code_string(
+                        "Warning: no live workers on the queue", CC_YELLOW))
+            if not done:
+                time.sleep(dist_queue.POLL_S)
+    except BaseException:
+        # workers see STOP, kill their simulations and exit
+        dist_queue.request_stop(qdir)
+        raise
+    finally:
+        dist_queue.close(qdir)
+        for proc in local:
+            proc.wait()
+
+def _run_queued_jobs(qdir, wid):
+    # pool process of run_worker: claim and run jobs until the queue is done
+    global _total
+    ran = 0
+    while not dist_queue.finished(qdir):
+        claimed = dist_queue.claim(qdir, wid)
+        if claimed is None:
+            time.sleep(dist_queue.POLL_S)
+            continue
+        job_id, job = claimed
+        _total = job['total']
+        rec = run_test(
+            job['test_path'], job['run_dir'], job['build_dir'],
+            make_args(**job['make_args']), keep_pass=job['keep_pass'],
+            stop_on_fail=job['stop_on_fail'], link_build=job['link_build'],
+            wall_budget=job.get('wall_budget'), suite=job.get('suite'))
+        dist_queue.complete(qdir, wid, job_id, {"worker": wid, "record": rec})
+        ran += 1
+    return ran
+
+def run_worker(qdir, jobs):
+    qdir = os.path.abspath(qdir)
+    wid = dist_queue.worker_id()
+    w = min(jobs, MAX_WORKERS)
+    print(f"Worker '{wid}' serving '{qdir}' with {w} slot(s)")
+    start_time = datetime.datetime.now()
+    # stop flag stays local, a failure is reported through the coordinator
+    init_args = (Value('i', 0), Event(), 0)
+    with Pool(w, initializer=_init_worker, initargs=init_args) as pool:
+        res = pool.starmap_async(_run_queued_jobs, [(qdir, wid)] * w)
+        while not res.ready():
+            dist_queue.heartbeat(qdir, wid)
+            if dist_queue.stop_requested(qdir):
+                # SIGTERM to pool processes kills their simulator groups
+                pool.terminate()
+                print(f"Worker '{wid}' stopped by the coordinator")
+                break
+            res.wait(dist_queue.POLL_S)
+        else:
+            print(f"Worker '{wid}' ran {sum(res.get())} test(s)")
+    print_runtime(start_time, "Worker")
+
 def run_coverage(all_tests, run_dir):
     print("\nMerging code coverage...")
     # Makefile (+ its includes) must resolve from run_dir to run the targets
@@ -435,14 +799,26 @@ def parse_args():
     parser.add_argument('-o', '--build_only', action='store_true', help="Only build the testbench")
     parser.add_argument('-k', '--keep_build', action='store_true', default=False, help="Reuse existing build if available")
     parser.add_argument('-b', '--rebuild_all', action='store_true', default=False, help="Rebuild everything: RTL, ISA sim, cosim. Takes priority over -k if both are specified")
+    parser.add_argument('--build_cache', metavar='DIR', help="Shared build cache directory. A new run dir reuses a cached elaborated snapshot when filelist, sources, defines, coverage and cosim/ISA sim sources are unchanged")
+    parser.add_argument('--build_cache_size', type=float, default=50, metavar='GB', help="Disk budget of the build cache in GB, least recently used builds are evicted first (default: 50)")
     parser.add_argument('-p', '--keep_pass', action='store_true', default=False, help="Keep rundir of passed tests. Applicable only if -k is used")
+    parser.add_argument('-i', '--incremental', action='store_true', default=False, help="Run only tests that failed or have no result in the run dir, or whose test image, build sources (the build cache key) or run arguments changed since their last run. Keeps the run dir and its results; combine with -k to also keep the build")
     parser.add_argument('-s', '--stop_on_fail', action='store_true', default=False, help="Stop execution after the first test failure")
+    parser.add_argument('-l', '--link_build', action='store_true', default=False, help="Hardlink the read-only elaborated snapshot into each test dir instead of copying the whole build. Only files xsim writes at runtime (and the coverage DB) are copied")
+    parser.add_argument('--history', default=RUN_HISTORY, metavar='FILE', help="Per-test runtime history used to schedule longest-expected tests first, updated after each suite. Pass '' to disable (default: $REPO_ROOT/.run_test_history.json)")
     parser.add_argument('-j', '--jobs', type=int, default=MAX_WORKERS, help="Number of parallel jobs to run (default: number of CPU cores)")
+    parser.add_argument('--dist', action='store_true', default=False, help="Coordinate the suite instead of simulating locally: tests are queued in the run dir and run by '--worker' processes on any host that mounts the run dir and REPO_ROOT at the same paths. -j is then the total number of worker slots, used for the runtime estimate")
+    parser.add_argument('--dist_local', type=int, default=0, metavar='N', help="With --dist, also start N local single-slot workers")
+    parser.add_argument('--worker', metavar='QUEUE_DIR', help="Run as a worker for a --dist coordinator: claim and simulate tests from QUEUE_DIR (printed by the coordinator) with -j parallel jobs, until the suite is done")
     parser.add_argument('-c', '--timeout_clocks', type=int, default=2_000_000, help="Number of clocks before simulations times out")
+    parser.add_argument('--watchdog', type=float, default=0, metavar='SCALE', help="Kill a simulation still running after SCALE times its expected wall-clock time (plus a fixed slack) and report it as TIMEOUT, e.g. 3. Expected time is the larger of the test's runtime history and -c clocks at the measured simulation rate, both from earlier runs with the same wave, coverage and kanata options. Tests with neither have no watchdog (default: 0, disabled)")
     parser.add_argument('-v', '--log_level', type=str, default="INFO", help="Log level during simulation")
     parser.add_argument('--coverage', action='store_true', default=False, help="Build instrumented for code coverage, then merge per-test DBs and generate an HTML report after the suite")
     parser.add_argument('--coverage_only', action='store_true', default=False, help="Only merge coverage and generate the report. Relies on existing instrumented test directories from a prior --coverage run")
     #parser.add_argument('--seed', type=int, help="Seed value for the tests")
+    parser.add_argument('--perf_gate', nargs='?', const=PERF_BASELINE, metavar='BASELINE', help="After the suite, compare each passing test's cosim hw_stats.json (cycles, cpi, L1I/L1D MPKI) against the BASELINE file and fail tests that got slower than the tolerances allow as PERF-REGRESSED. Tests without a baseline entry are only reported (default BASELINE: $REPO_ROOT/perf_baseline.json)")
+    parser.add_argument('--perf_tol', nargs='+', metavar='METRIC=PCT', help=f"Allowed increase over the baseline in %% per metric, for --perf_gate (default: {' '.join(f'{m}={t:g}' for m, t in perf_gate.TOLERANCES.items())})")
+    parser.add_argument('--perf_update', action='store_true', help="Write the metrics of this run's passing tests into the --perf_gate baseline instead of gating on it")
     parser.add_argument('--dry_run', action='store_true', default=False, help="Print tests that would run without building or simulating")
     parser.add_argument('--log_wave', action='store_true', help="Collect .wdb waveform, all modules from the top down")
     parser.add_argument('--log_vcd', action='store_true', help="Collect .vcd waveform, all modules from the top down")
@@ -454,6 +830,10 @@ def main():
     args = parse_args()
     ma = make_args(args.timeout_clocks, args.log_level, args.log_kanata)
 
+    if args.worker: # everything else comes from the coordinator's jobs
+        run_worker(args.worker, args.jobs)
+        sys.exit(0)
+
     # check arguments
     if args.test and args.testlist:
         raise ValueError("Cannot use both -t|--test and --testlist. Choose one")
@@ -464,6 +844,11 @@ def main():
     if args.coverage and args.coverage_only:
         raise ValueError(
             "Cannot use both --coverage and --coverage_only. Choose one.")
+    if args.dist_local and not args.dist:
+        raise ValueError("--dist_local needs --dist.")
+    if args.perf_update and not args.perf_gate:
+        args.perf_gate = PERF_BASELINE
+    perf_tol = perf_gate.parse_tolerances(args.perf_tol)
     if args.coverage_only and not args.rundir:
         raise ValueError(
             "--coverage_only needs -r|--rundir pointing at an " +
@@ -522,43 +907,126 @@ def main():
                 "coverage DBs will be empty. Rebuild without -k.", CC_YELLOW))
 
     else:
-        if os.path.exists(run_dir): # clean up previous run_dir if it exists
+        # clean up previous run_dir if it exists, incremental needs its results
+        if os.path.exists(run_dir) and not args.incremental:
             shutil.rmtree(run_dir)
-        os.makedirs(run_dir)
-        build_tb(build_dir, args.rebuild_all, coverage=args.coverage)
+        os.makedirs(run_dir, exist_ok=True)
+        build_tb(build_dir, args.rebuild_all, coverage=args.coverage,
+                 cache_dir=args.build_cache,
+                 cache_size_gb=args.build_cache_size)
 
     if args.build_only:
         print(f"Building done at '{build_dir}'. Exiting")
         sys.exit(0)
 
+    # records of tests this suite ran are only trusted if it wrote them, an
+    # older one in a kept run dir may be from a suite where the test passed
+    to_run, suite = [], run_results.new_suite_id()
     if not args.coverage_only:
-        run_suite(all_tests, run_dir, build_dir, ma, args.jobs,
-                  args.keep_pass, args.stop_on_fail)
+        # sources the snapshot was built from, not a hash of xsim.dir, which
+        # differs between two elaborations of the same sources
+        snapshot = build_cache.read_build_key(build_dir)
+        if snapshot is None: # built before keys were recorded
+            touch = os.path.join(build_dir, ".elab.touchfile")
+            snapshot = f"elab@{os.path.getmtime(touch)}" \
+                if os.path.exists(touch) else "unknown"
+        with open(RUN_CFG) as f:
+            run_args = (ma.timeout_clocks, ma.log_level, ma.log_kanata, f.read())
+        inputs = {t: run_results.test_inputs(t, snapshot, run_args)
+                  for t in all_tests}
+        to_run = all_tests
+        if args.incremental:
+            prev = run_results.load(run_dir)
+            to_run = []
+            for t in all_tests:
+                reason = run_results.rerun_reason(
+                    prev.get(format_test_name(t)), inputs[t])
+                if reason:
+                    to_run.append(t)
+                    print(f"Rerun '{format_test_name(t)}': {reason}")
+            print(f"Incremental: {len(to_run)}/{len(all_tests)} test(s) " +
+                  "to run, the rest passed with unchanged inputs")
+        if to_run:
+            run_suite(to_run, run_dir, build_dir, ma, args.jobs,
+                      args.keep_pass, args.stop_on_fail, args.link_build,
+                      args.history, inputs, args.dist, args.dist_local,
+                      args.watchdog,
+                      run_history.sim_mode(args.log_wave, args.log_vcd,
+                                           args.coverage, args.log_kanata),
+                      suite)
 
     # check test suite results
     all_tests_passed = True
     tests_num = len(all_tests)
     tests_passed = 0
     failed_tests = []
+    results = run_results.load(run_dir)
+    ran = set(to_run)
+    perf_base = perf_gate.load_baseline(args.perf_gate) \
+        if args.perf_gate else {}
+    perf_cur = {} # {test_name: metrics} of passing tests
+    perf_compared, perf_regressed, perf_unchecked = 0, 0, []
     print("\nSummary:")
     for test_path in all_tests:
         test_name = format_test_name(test_path)
         p = get_paths_for_test(run_dir, test_name)
-        t_passed, t_msg = check_test_status(p['status_file'], p['test_log'])
+        rec = results.get(test_name)
+        if rec is not None and test_path in ran and rec.get("suite") != suite:
+            rec = None
+        if rec is not None:
+            t_passed = rec["status"] == run_results.PASSED
+            t_msg = rec["reason"]
+            t_no_status = rec["status"] in (run_results.ERROR,
+                                            run_results.TIMEOUT)
+        else: # no record from this suite (e.g. killed), use test.status
+            t_passed, t_msg = check_test_status(p['status_file'], p['test_log'])
+            t_no_status = not os.path.exists(p['status_file'])
+        status_str = "PASSED" if t_passed else "FAILED"
+
+        if args.perf_gate and t_passed:
+            hw_stats = perf_gate.find_hw_stats(p['test_dir'], test_name)
+            cur = perf_gate.metrics(hw_stats) if hw_stats else None
+            if cur:
+                perf_cur[test_name] = cur
+            if not cur or test_name not in perf_base:
+                perf_unchecked.append(test_name)
+            elif not args.perf_update:
+                perf_compared += 1
+                regressed = perf_gate.compare(
+                    cur, perf_base[test_name], perf_tol)
+                if regressed:
+                    perf_regressed += 1
+                    t_passed = False
+                    status_str = perf_gate.PERF_REGRESSED
+                    t_msg = perf_gate.format_regression(regressed)
+
         if t_passed:
             tests_passed += 1
             cc = CC_GREEN
         else:
             all_tests_passed = False
-            cc = CC_RED if os.path.exists(p['status_file']) else CC_YELLOW
+            cc = CC_YELLOW if t_no_status else CC_RED
             failed_tests.append(f"\n{INDENT}{test_name}")
 
-        status_str = "PASSED" if t_passed else "FAILED"
         status = f"Test '{test_name}' {status_str}"
         if t_msg:
             status += f" {t_msg}. Log at {p['test_log']}"
         print(color_code_string(status, cc))
 
+    if args.perf_update:
+        perf_base.update(perf_cur)
+        perf_gate.save_baseline(args.perf_gate, perf_base)
+        print(f"\nPerf baseline: {len(perf_cur)} test(s) written to " +
+              f"'{args.perf_gate}'")
+    elif args.perf_gate:
+        print(f"\nPerf gate: {perf_compared} " +
+              f"test(s) compared against '{args.perf_gate}', " +
+              f"{perf_regressed} regressed")
+        if perf_unchecked:
+            print(color_code_string(
+                f"No hw_stats or baseline entry for {len(perf_unchecked)} " +
+                "test(s): " + ", ".join(perf_unchecked), CC_YELLOW))
+
     print(f"\nTest suite DONE. Pass rate: {tests_passed}/{tests_num} passed;",
           end=" ")
     if all_tests_passed:
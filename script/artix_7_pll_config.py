@@ -1,70 +1,186 @@
 #!/usr/bin/env python3
+"""Artix-7 PLLE2/MMCME2 config solver
 
-import sys
+Every legal (DIVCLK_DIVIDE, CLKFBOUT_MULT) pair is checked against the VCO and
+PFD ranges of the primitive and speed grade, and each CLKOUTn gets the divider
+closest to its target in closed form, so there is no per-divider search.
+MMCM fractional dividers (CLKFBOUT_MULT_F, CLKOUT0_DIVIDE_F) step by 1/8.
 
-clkin1_mhz = 100 # mhz, default
+Configs are returned Pareto-optimal over: worst output error, number of
+fractional counters (add period jitter on the MMCM), VCO (higher is lower
+jitter) and PFD frequency (phase detector updates, higher is lower jitter).
 
-if len(sys.argv) == 2:
-    clkin1_mhz = int(sys.argv[1])
-print(f"Using {clkin1_mhz}MHz oscillator input for config checks")
+Usage:
+    artix_7_pll_config.py [CLKIN_MHZ]                 # best per usual target
+    artix_7_pll_config.py 100 -t 50 200 --mmcm --all  # one MMCM, two outputs
+"""
 
-clkin1 = (clkin1_mhz * 1_000_000) # hz
-clkin1_period = (1/clkin1) * 1_000_000_000 # to ns
-# freq_out = clkin1 * (clkfbout_mult / (divclk_divide * clkout0_divide))
-
-pll_vco_range = range(800, 1600) # MHz
-mmcm_vco_range = range(600, 1200) # MHz
-
-vco_range = pll_vco_range
+import argparse
+import math
 
 # ranges: https://docs.amd.com/r/en-US/ug953-vivado-7series-libraries/PLLE2_ADV
-clkfbout_mult_range = range(2, 64)
-clk_dout0_divide_range = range(1, 128)
-divclk_divide_range = range(1, 56)
-divclk_divide_range = range(1, 2) # fixed: 1
-
-BEST = True
-RANGE = 0 # 1_000_000 # hz above/below SEARCH
-t_mhz_list = (50, 55, 60, 65, 70, 75, 80, 90, 100)
-
-gp = lambda freq_mhz: 1_000_000_000/freq_mhz
-for t_mhz in t_mhz_list:
-    T_HZ = t_mhz * 1_000_000 # hz
-    PERIOD = 1_000_000_000 / T_HZ # ns
-    print(f"\nSearching for frequencies around {T_HZ/1_000_000} MHz, "
-        f"period={PERIOD:.3f} ns, half period={PERIOD/2:.3f} ns")
-
-    str_list = []
-    str_best = ""
-    vco_best = 0
-    diff_best = 1_000_000
-    for divclk_divide in divclk_divide_range:
-        for clkfbout_mult in clkfbout_mult_range:
-            for clkout0_divide in clk_dout0_divide_range:
-                str_app = ""
-                freq = clkin1 * (clkfbout_mult/(divclk_divide*clkout0_divide))
-                freq_in_range = (T_HZ-RANGE <= freq <= T_HZ+RANGE)
-                vco = clkfbout_mult * 1000 / (clkin1_period * divclk_divide)
-                vco_in_range = min(vco_range) <= vco <= max(vco_range)
-                if freq_in_range and vco_in_range:
-                    if RANGE:
-                        str_app = \
-                            f"(f={freq/1_000_000:.3f} MHz, p={gp(freq):.3f} ns)"
-                    str_list.append("    "
-                        f"CLKFBOUT_MULT = {clkfbout_mult}, "
-                        f"CLKOUT0_DIVIDE = {clkout0_divide}, "
-                        f"DIVCLK_DIVIDE = {divclk_divide}, "
-                        f"VCO: {vco}MHz; " +
-                        str_app
-                    )
-                    diff = abs(T_HZ - freq)
-                    if vco > vco_best and diff <= diff_best:
-                        vco_best = vco
-                        diff_best = diff
-                        str_best = str_list[-1]
-
-    if BEST:
-        print(str_best)
+# limits per speed grade: DS181, Artix-7 data sheet, MMCM/PLL switching chars
+PRIMITIVES = {
+    "pll": {
+        "outputs": 6,
+        "divclk": (1, 56),
+        "mult": (2, 64),
+        "divide": (1, 128),
+        "frac_mult": False,
+        "frac_out0": False,
+        "clkin": (19, 800),
+        "pfd": {1: (19, 450), 2: (19, 500), 3: (19, 550)},
+        "vco": {1: (800, 1600), 2: (800, 1866), 3: (800, 2133)},
+    },
+    "mmcm": {
+        "outputs": 7,
+        "divclk": (1, 106),
+        "mult": (2, 64),
+        "divide": (1, 128),
+        "frac_mult": True,
+        "frac_out0": True, # 2.000 - 128.000
+        "clkin": (10, 800),
+        "pfd": {1: (10, 450), 2: (10, 500), 3: (10, 550)},
+        "vco": {1: (600, 1200), 2: (600, 1440), 3: (600, 1600)},
+    },
+}
+FRAC_STEP = 8 # 1/8 increments
+T_MHZ_LIST = (50, 55, 60, 65, 70, 75, 80, 90, 100)
+
+def _best_divide(vco, target, lo, hi, frac):
+    """(divide, freq) closest to target for one output"""
+    q = vco / target
+    if frac:
+        cands = {math.floor(q * FRAC_STEP) / FRAC_STEP,
+                 math.ceil(q * FRAC_STEP) / FRAC_STEP}
+        # fractional values only from 2.000 up
+        cands = {c for c in cands if c == int(c) or c >= 2}
     else:
-        for s in str_list:
-            print(s)
+        cands = {math.floor(q), math.ceil(q)}
+    cands = {min(max(c, lo), hi) for c in cands} or {lo}
+    div = min(cands, key=lambda c: (abs(vco / c - target), c))
+    return div, vco / div
+
+def _mults(lo, hi, frac):
+    step = FRAC_STEP if frac else 1
+    return [m / step for m in range(lo * step, hi * step + 1)]
+
+def _objectives(c):
+    # all minimized
+    return (c["max_err_ppm"], c["frac_counters"], -c["vco_mhz"], -c["pfd_mhz"])
+
+def pareto(configs):
+    """configs not dominated in _objectives by another one"""
+    front = []
+    # sorted so that no later config can dominate an earlier one
+    for c in sorted(configs, key=_objectives):
+        oc = _objectives(c)
+        if any(all(a <= b for a, b in zip(_objectives(f), oc))
+               for f in front):
+            continue
+        front.append(c)
+    return front
+
+def solve(clkin_mhz, targets_mhz, primitive="pll", speed_grade=1,
+          max_err_ppm=None, all_configs=False):
+    """Pareto-optimal configs of `primitive` generating targets_mhz on
+    CLKOUT0.. from clkin_mhz, best (lowest error, fewest fractional counters,
+    then highest VCO) first.
+    Each config is a dict with divclk_divide, clkfbout_mult, vco_mhz, pfd_mhz,
+    outputs [(divide, freq_mhz, err_ppm)], max_err_ppm and frac_counters"""
+    prim = PRIMITIVES[primitive]
+    if not 1 <= len(targets_mhz) <= prim["outputs"]:
+        raise ValueError(f"{primitive} has {prim['outputs']} outputs, "
+                         f"got {len(targets_mhz)} targets")
+    if not prim["clkin"][0] <= clkin_mhz <= prim["clkin"][1]:
+        raise ValueError(f"CLKIN1 {clkin_mhz}MHz outside {primitive} range "
+                         f"{prim['clkin']}")
+    pfd_lo, pfd_hi = prim["pfd"][speed_grade]
+    vco_lo, vco_hi = prim["vco"][speed_grade]
+    div_lo, div_hi = prim["divide"]
+    mults = _mults(*prim["mult"], prim["frac_mult"])
+
+    configs = []
+    for divclk in range(prim["divclk"][0], prim["divclk"][1] + 1):
+        pfd = clkin_mhz / divclk
+        if pfd < pfd_lo:
+            break # only gets lower
+        if pfd > pfd_hi:
+            continue
+        for mult in mults:
+            vco = pfd * mult
+            if vco < vco_lo:
+                continue
+            if vco > vco_hi:
+                break
+            outputs = []
+            for i, t in enumerate(targets_mhz):
+                frac = prim["frac_out0"] and i == 0
+                div, freq = _best_divide(vco, t, div_lo, div_hi, frac)
+                # rounded so float noise doesn't break ties between exact ones
+                outputs.append((div, freq, round(abs(freq - t) / t * 1e6, 3)))
+            max_err = max(o[2] for o in outputs)
+            if max_err_ppm is not None and max_err > max_err_ppm:
+                continue
+            configs.append({
+                "primitive": primitive,
+                "divclk_divide": divclk,
+                "clkfbout_mult": mult,
+                "vco_mhz": vco,
+                "pfd_mhz": pfd,
+                "outputs": outputs,
+                "max_err_ppm": max_err,
+                "frac_counters": (mult != int(mult)) +
+                    sum(o[0] != int(o[0]) for o in outputs),
+            })
+    return configs if all_configs else pareto(configs)
+
+def best(clkin_mhz, targets_mhz, primitive="pll", speed_grade=1):
+    """first config of the Pareto front, None if nothing is legal"""
+    front = solve(clkin_mhz, targets_mhz, primitive, speed_grade)
+    return front[0] if front else None
+
+def speed_grade_of(part):
+    """speed grade from a part name, e.g. 1 for xc7a100tcsg324-1"""
+    tail = part.rsplit("-", 1)[-1]
+    return int(tail[0]) if tail[:1].isdigit() else 1
+
+def fmt_config(c):
+    frac = c["primitive"] == "mmcm"
+    s = f"DIVCLK_DIVIDE = {c['divclk_divide']}, " + \
+        (f"CLKFBOUT_MULT_F = {c['clkfbout_mult']:.3f}, " if frac else
+         f"CLKFBOUT_MULT = {c['clkfbout_mult']:.0f}, ")
+    for i, (div, freq, err) in enumerate(c["outputs"]):
+        name = f"CLKOUT{i}_DIVIDE" + ("_F" if frac and i == 0 else "")
+        s += f"{name} = {div:g} ({freq:.3f} MHz, {err:.0f} ppm), "
+    return s + f"VCO: {c['vco_mhz']:.3f}MHz, PFD: {c['pfd_mhz']:.3f}MHz"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Artix-7 PLL/MMCM config solver")
+    parser.add_argument("clkin_mhz", nargs="?", type=float, default=100, help="Oscillator input frequency in MHz (default: 100)")
+    parser.add_argument("-t", "--targets", nargs="+", type=float, help=f"Target MHz of CLKOUT0, CLKOUT1, ... of one primitive. Default: each of {', '.join(map(str, T_MHZ_LIST))} solved on its own")
+    parser.add_argument("--mmcm", action="store_true", help="Solve for MMCME2 (fractional dividers) instead of PLLE2")
+    parser.add_argument("--speed_grade", type=int, choices=(1, 2, 3), default=1, help="Device speed grade, sets VCO and PFD limits (default: 1)")
+    parser.add_argument("--max_err_ppm", type=float, help="Drop configs with any output further than this from its target")
+    parser.add_argument("--all", action="store_true", help="Print the whole Pareto front instead of the best config")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    primitive = "mmcm" if args.mmcm else "pll"
+    print(f"Using {args.clkin_mhz:g}MHz oscillator input for {primitive} " +
+          f"config checks, speed grade -{args.speed_grade}")
+    target_sets = [args.targets] if args.targets else \
+        [[t] for t in T_MHZ_LIST]
+    for targets in target_sets:
+        print("\nSearching for " + ", ".join(
+            f"{t:g} MHz (period={1000 / t:.3f} ns)" for t in targets))
+        front = solve(args.clkin_mhz, targets, primitive, args.speed_grade,
+                      args.max_err_ppm)
+        if not front:
+            print("    no legal config")
+        for c in front if args.all else front[:1]:
+            print(f"    {fmt_config(c)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Content-addressed cache of elaborated testbench builds for run_test.py
+
+Entries are keyed by a hash of everything that feeds `make elab`: the filelist
+as resolved by parse_filelist.py, the files it points to, include dir contents,
+defines, COV flag, build makefiles and the cosim/ISA sim sources. A new run dir
+with the same key copies the snapshot out of the cache instead of re-running
+xvlog/xelab. Entries are evicted least-recently-used first once the cache
+grows past its disk budget.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from script import parse_filelist
+from script.utils import get_dir_size
+
+SOURCE_EXT = ('.cpp', '.c', '.h', '.hpp', '.mk')
+ENTRY_META = "cache_entry.json"
+ENTRY_STAMP = ".last_used" # mtime is the LRU timestamp
+COSIM_SO_CACHED = "ama-riscv-cosim.so"
+# in each build dir: build_key() of the sources it was elaborated from, the
+# identity of its snapshot for incremental runs (xsim.dir itself differs
+# between two elaborations of the same sources)
+BUILD_KEY_FILE = "build_key.txt"
+
+# hashing
+def _hash_file(h, path):
+    h.update(path.encode())
+    h.update(b"\0")
+    if not os.path.isfile(path):
+        h.update(b"<missing>")
+        return
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(b"\0")
+
+def _source_files(root):
+    # cpp/h/make sources under root, skipping build output dirs
+    out = []
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        dirnames[:] = sorted(d for d in dirnames
+                             if not d.startswith(("build", ".")))
+        for fn in sorted(filenames):
+            if fn.endswith(SOURCE_EXT) or fn == "Makefile":
+                out.append(os.path.join(dirpath, fn))
+    return out
+
+def resolve_filelist(filelist, repo_root):
+    """All parse_filelist.py modes for `filelist`, as {mode: [tokens]}"""
+    return parse_filelist.parse(
+        filelist, env=dict(os.environ, REPO_ROOT=repo_root))
+
+def build_key(repo_root, make_dir, filelist, coverage):
+    """Hex digest identifying an elaborated snapshot"""
+    h = hashlib.sha256()
+    h.update(repo_root.encode())
+    h.update(f"cov={int(bool(coverage))}".encode())
+
+    fl = resolve_filelist(filelist, repo_root)
+    _hash_file(h, filelist)
+    for mode in ('defines', 'worklib'):
+        h.update(f"{mode}={' '.join(fl[mode])}".encode())
+    for path in fl['design'] + fl['verif']:
+        _hash_file(h, path)
+    for d in fl['include-dirs']: # make deps on $(dir)/*
+        for fn in sorted(os.listdir(d)) if os.path.isdir(d) else []:
+            _hash_file(h, os.path.join(d, fn))
+
+    # build recipe, then cosim and ISA sim sources (cosim/src -> sim/src)
+    for mk in ("Makefile", "Makefile.sources.mk"):
+        _hash_file(h, os.path.realpath(os.path.join(make_dir, mk)))
+    for path in _source_files(os.path.join(repo_root, "cosim")):
+        _hash_file(h, path)
+    return h.hexdigest()
+
+# cache entries
+def _entry_dir(cache_dir, key):
+    return os.path.join(cache_dir, key)
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, ENTRY_META)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def lookup(cache_dir, key):
+    """Path of a complete cache entry for `key`, or None"""
+    entry = _entry_dir(cache_dir, key)
+    if _read_meta(entry) is None: # meta is written last, marks it complete
+        return None
+    return entry
+
+def restore(entry, build_dir, skip_names, cosim_so=None):
+    """Copy a cached snapshot into build_dir; returns bytes copied"""
+    os.utime(os.path.join(entry, ENTRY_STAMP))
+    ignore = shutil.ignore_patterns(ENTRY_META, ENTRY_STAMP, COSIM_SO_CACHED,
+                                    *skip_names)
+    shutil.copytree(entry, build_dir, symlinks=True, ignore=ignore,
+                    dirs_exist_ok=True)
+
+    # cosim .so lives in the shared cosim dir, not the build dir; put back the
+    # one the snapshot was elaborated against if a later build replaced it
+    cached_so = os.path.join(entry, COSIM_SO_CACHED)
+    if cosim_so and os.path.isfile(cached_so):
+        if not os.path.isfile(cosim_so) or \
+        _file_digest(cosim_so) != _file_digest(cached_so):
+            os.makedirs(os.path.dirname(cosim_so), exist_ok=True)
+            # never rewrite it in place, simulations of other run dirs may
+            # have it mapped; they keep the old inode until they exit
+            tmp = f"{cosim_so}.tmp{os.getpid()}"
+            shutil.copy2(cached_so, tmp)
+            os.replace(tmp, cosim_so)
+    return _read_meta(entry).get("size", 0)
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+def store(cache_dir, key, build_dir, skip_names, cosim_so=None,
+          replace=False):
+    """Add build_dir to the cache under `key`. Copies into a temp dir first and
+    renames it into place, so concurrent runs never see a partial entry.
+    An existing entry is kept unless `replace` (a forced rebuild)"""
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = _entry_dir(cache_dir, key)
+    if not replace and lookup(cache_dir, key):
+        return entry
+    tmp = f"{entry}.tmp{os.getpid()}"
+    if os.path.exists(tmp):
+        shutil.rmtree(tmp)
+    ignore = shutil.ignore_patterns(*skip_names)
+    shutil.copytree(build_dir, tmp, symlinks=True, ignore=ignore)
+    if cosim_so and os.path.isfile(cosim_so):
+        shutil.copy2(cosim_so, os.path.join(tmp, COSIM_SO_CACHED))
+    open(os.path.join(tmp, ENTRY_STAMP), 'w').close()
+    with open(os.path.join(tmp, ENTRY_META), 'w') as f:
+        json.dump({"key": key, "size": get_dir_size(tmp),
+                   "created": time.time()}, f, indent=4)
+
+    # move aside the entry being replaced, or one without meta (never
+    # completed, e.g. crashed copy) that would block the rename for good
+    old = None
+    if os.path.exists(entry) and (replace or _read_meta(entry) is None):
+        old = f"{entry}.old{os.getpid()}"
+        try:
+            os.rename(entry, old)
+        except OSError: # another run moved it first
+            old = None
+    try:
+        os.rename(tmp, entry)
+    except OSError: # another run stored the same key first, keep theirs
+        shutil.rmtree(tmp, ignore_errors=True)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+    return entry
+
+def evict(cache_dir, budget_bytes, keep=None):
+    """Drop least-recently-used entries until the cache fits the budget.
+    Returns the list of evicted keys"""
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry = _entry_dir(cache_dir, key)
+        meta = _read_meta(entry)
+        if meta is None:
+            continue
+        try:
+            last_used = os.path.getmtime(os.path.join(entry, ENTRY_STAMP))
+        except OSError:
+            last_used = meta.get("created", 0)
+        entries.append((last_used, key, meta.get("size", 0)))
+
+    total = sum(size for _, _, size in entries)
+    evicted = []
+    for _, key, size in sorted(entries):
+        if total <= budget_bytes:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(_entry_dir(cache_dir, key), ignore_errors=True)
+        total -= size
+        evicted.append(key)
+    return evicted
+
+# build key of a build dir
+def write_build_key(build_dir, key):
+    with open(os.path.join(build_dir, BUILD_KEY_FILE), 'w') as f:
+        f.write(key + "\n")
+
+def read_build_key(build_dir):
+    """Key of the sources build_dir was elaborated from, None for builds
+    made before keys were recorded"""
+    try:
+        with open(os.path.join(build_dir, BUILD_KEY_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
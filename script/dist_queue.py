@@ -0,0 +1,160 @@
+"""Shared-filesystem job queue for distributing run_test.py over hosts
+
+The coordinator (run_test.py --dist) owns a queue dir inside the run dir, which
+has to be on a filesystem all worker hosts mount at the same path (the build
+and test dirs are there anyway). Workers (run_test.py --worker QUEUE_DIR) claim
+jobs by renaming them, so no locking or server process is needed:
+
+    pending/<seq>_<test>.json         submitted, claimed in name order
+    claimed/<seq>_<test>.json@<id>    being run by worker <id>
+    done/<seq>_<test>.json            result record written by the worker
+    workers/<id>                      heartbeat, mtime refreshed while alive
+    STOP, CLOSED                      stop-on-fail / no more jobs coming
+
+Jobs of workers with a stale heartbeat are put back into pending.
+"""
+
+import json
+import os
+import shutil
+import socket
+import time
+
+PENDING = "pending"
+CLAIMED = "claimed"
+DONE = "done"
+WORKERS = "workers"
+STOP = "STOP"
+CLOSED = "CLOSED"
+POLL_S = 1.0
+STALE_S = 120.0 # heartbeat age after which a worker's jobs are requeued
+
+def worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _write_json(path, obj):
+    # rename into place so readers never see a partial file
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _listdir(path):
+    try:
+        return sorted(os.listdir(path))
+    except FileNotFoundError:
+        return []
+
+# coordinator side
+def init(qdir):
+    if os.path.exists(qdir):
+        shutil.rmtree(qdir)
+    for d in (PENDING, CLAIMED, DONE, WORKERS):
+        os.makedirs(os.path.join(qdir, d))
+
+def submit(qdir, jobs):
+    """Queue jobs (list of dicts) in order, returns their ids"""
+    ids = []
+    for seq, job in enumerate(jobs):
+        job_id = f"{seq:06d}_{job['name']}.json"
+        _write_json(os.path.join(qdir, PENDING, job_id), job)
+        ids.append(job_id)
+    return ids
+
+def collect(qdir, seen):
+    """New (job_id, result) pairs from done/, job ids are added to seen"""
+    out = []
+    for job_id in _listdir(os.path.join(qdir, DONE)):
+        if job_id in seen or not job_id.endswith(".json"):
+            continue
+        res = _read_json(os.path.join(qdir, DONE, job_id))
+        if res is not None:
+            seen.add(job_id)
+            out.append((job_id, res))
+    return out
+
+def requeue_stale(qdir, now=None):
+    """Move jobs of workers without a recent heartbeat back to pending"""
+    now = now or time.time()
+    requeued = []
+    for name in _listdir(os.path.join(qdir, CLAIMED)):
+        job_id, _, wid = name.partition("@")
+        claimed = os.path.join(qdir, CLAIMED, name)
+        try:
+            beat = os.path.getmtime(os.path.join(qdir, WORKERS, wid))
+        except OSError:
+            beat = os.path.getmtime(claimed) if os.path.exists(claimed) else now
+        if now - beat < STALE_S:
+            continue
+        try:
+            os.rename(claimed, os.path.join(qdir, PENDING, job_id))
+            requeued.append(job_id)
+        except OSError:
+            pass
+    return requeued
+
+def workers(qdir, now=None):
+    """Ids of workers with a live heartbeat"""
+    now = now or time.time()
+    live = []
+    for wid in _listdir(os.path.join(qdir, WORKERS)):
+        try:
+            if now - os.path.getmtime(os.path.join(qdir, WORKERS, wid)) \
+            < STALE_S:
+                live.append(wid)
+        except OSError:
+            pass
+    return live
+
+def request_stop(qdir):
+    open(os.path.join(qdir, STOP), 'w').close()
+
+def close(qdir):
+    open(os.path.join(qdir, CLOSED), 'w').close()
+
+# worker side
+def heartbeat(qdir, wid):
+    path = os.path.join(qdir, WORKERS, wid)
+    try:
+        with open(path, 'a'):
+            os.utime(path)
+    except OSError: # queue not created yet or already cleaned up
+        pass
+
+def stop_requested(qdir):
+    return os.path.exists(os.path.join(qdir, STOP))
+
+def finished(qdir):
+    """No more work: stopped, or closed with nothing left pending"""
+    return stop_requested(qdir) or (
+        os.path.exists(os.path.join(qdir, CLOSED)) and
+        not _listdir(os.path.join(qdir, PENDING)))
+
+def claim(qdir, wid):
+    """(job_id, job) of the first pending job this worker got, or None"""
+    for job_id in _listdir(os.path.join(qdir, PENDING)):
+        if not job_id.endswith(".json"):
+            continue
+        claimed = os.path.join(qdir, CLAIMED, f"{job_id}@{wid}")
+        try:
+            os.rename(os.path.join(qdir, PENDING, job_id), claimed)
+        except OSError: # another worker was first
+            continue
+        job = _read_json(claimed)
+        if job is not None:
+            return job_id, job
+    return None
+
+def complete(qdir, wid, job_id, result):
+    _write_json(os.path.join(qdir, DONE, job_id), result)
+    try:
+        os.remove(os.path.join(qdir, CLAIMED, f"{job_id}@{wid}"))
+    except OSError: # requeued meanwhile, coordinator ignores the duplicate
+        pass
@@ -4,10 +4,22 @@
 # `set bitstream_dir ./bitstream` # dir where .bit and .mmi are
 # open hardware manager and connect target
 # `source ../../script/flash_bit.tcl`
+# to tag the captured UART output for get_run_stats.py, first start an
+# appending capture and point uart_log at it, e.g.
+# `stty -F /dev/ttyUSB1 115200 raw && cat /dev/ttyUSB1 >> output_raw_hw.log`
+# `set uart_log output_raw_hw.log`
 
 set start [expr {[clock seconds] - 1}]
 set device xc7a100t_0
 
+# ama_riscv_fpga.embench.crc32.bit -> embench_crc32,
+# ama_riscv_fpga.dhrystone.dhrystone.bit -> dhrystone, as in get_run_stats.py
+proc workload_name {bitfile} {
+    lassign [split [file rootname $bitfile] "."] _ suite name
+    if {[string first $name $suite] == 0} { return $suite }
+    return "${suite}_${name}"
+}
+
 # {bitfile_suffix  wait_time_seconds}
 set workloads {}
 lappend workloads {"ama_riscv_fpga.dhrystone.dhrystone.bit"     12}
@@ -60,6 +72,13 @@ foreach workload $workloads {
     set wait_sec [lindex $workload 1]
     set bitpath  "$bitstream_dir/$bitfile"
 
+    # appended before the workload runs, so its output follows the tag
+    if {[info exists uart_log]} {
+        set fh [open $uart_log a]
+        puts $fh "\nworkload: [workload_name $bitfile]"
+        close $fh
+    }
+
     puts "Flashing $bitpath"
     set_property PROBES.FILE      {} [get_hw_devices $device]
     set_property FULL_PROBES.FILE {} [get_hw_devices $device]
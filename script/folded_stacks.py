@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Aggregate folded callstacks across runs, diff them and draw flamegraphs
+
+Reads cosim's callstack_folded_{cycle,inst}_cosim.txt ('a;b;c; 123' per line)
+in one streaming pass per file into a trie of interned frames: each distinct
+stack is a node holding its parent, its frame id and one self count per input
+group, so memory scales with the number of unique stacks, never with lines.
+Many runs given as one group are summed.
+
+    folded_stacks.py top run*/callstack_folded_cycle_cosim.txt
+    folded_stacks.py merge run*/callstack_folded_cycle_cosim.txt --svg all.svg
+    folded_stacks.py diff -a base/*cycle*.txt -b new/*cycle*.txt --svg diff.svg
+
+diff writes 'stack count_a count_b' lines, the differential format of
+FlameGraph's difffolded.pl, and its flamegraph is sized by B and colored by
+the change from A: red frames got more expensive, blue ones cheaper.
+"""
+
+import argparse
+import array
+import contextlib
+import html
+import sys
+
+ROOT = 0 # trie node of the empty stack
+SVG_W = 1200
+FRAME_H = 16
+MIN_W = 0.1 # px, narrower frames (and everything above them) aren't drawn
+
+class StackTrie:
+    """Trie of stacks over interned frame names, with `groups` self counts per
+    node. Nodes are created after their parents, so ids are a topological
+    order and totals are a single reverse pass."""
+
+    def __init__(self, groups=1):
+        self.names = [] # frame id -> name
+        self.frame_ids = {}
+        self.parent = array.array("q", [-1])
+        self.frame = array.array("q", [-1])
+        self.self_ = [array.array("q", [0]) for _ in range(groups)]
+        self.child = {} # (parent << 32 | frame) -> node
+        self.skipped = 0 # malformed lines
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _intern(self, name):
+        fid = self.frame_ids.get(name)
+        if fid is None:
+            fid = self.frame_ids[name] = len(self.names)
+            self.names.append(name)
+        return fid
+
+    def _node(self, parent, name):
+        key = parent << 32 | self._intern(name)
+        node = self.child.get(key)
+        if node is None:
+            node = self.child[key] = len(self.parent)
+            self.parent.append(parent)
+            self.frame.append(key & 0xffffffff)
+            for s in self.self_:
+                s.append(0)
+        return node
+
+    def add(self, stack, count, group=0, _prev=None):
+        # _prev: ([names], [nodes]) of the previous stack, whose common
+        # prefix is reused without lookups (folded files are mostly sorted)
+        node, start = ROOT, 0
+        if _prev is not None:
+            names, nodes = _prev
+            for a, b in zip(stack, names):
+                if a != b:
+                    break
+                node = nodes[start]
+                start += 1
+            del names[start:], nodes[start:]
+        for name in stack[start:]:
+            node = self._node(node, name)
+            if _prev is not None:
+                _prev[0].append(name)
+                _prev[1].append(node)
+        self.self_[group][node] += count
+
+    def ingest(self, f, group=0):
+        """Add every 'frame;frame; count' line of the text file f"""
+        prev = ([], [])
+        for line in f:
+            stack, _, count = line.rstrip().rpartition(" ")
+            try:
+                count = int(count)
+            except ValueError:
+                if line.strip():
+                    self.skipped += 1
+                continue
+            self.add([s for s in stack.split(";") if s], count, group, prev)
+
+    def totals(self, group=0):
+        """Per node self count plus everything below it"""
+        tot = array.array("q", self.self_[group])
+        for node in range(len(self) - 1, 0, -1):
+            tot[self.parent[node]] += tot[node]
+        return tot
+
+    def children(self):
+        """(offsets, kids): children of node n are kids[offsets[n]:offsets[n+1]],
+        in creation order, as flat arrays instead of a list per node"""
+        n = len(self)
+        offsets = array.array("q", [0]) * (n + 1)
+        for node in range(1, n):
+            offsets[self.parent[node] + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        fill = array.array("q", offsets)
+        kids = array.array("q", [0]) * max(n - 1, 0)
+        for node in range(1, n):
+            p = self.parent[node]
+            kids[fill[p]] = node
+            fill[p] += 1
+        return offsets, kids
+
+    def depths(self):
+        depth = array.array("q", [0]) * len(self)
+        for node in range(1, len(self)):
+            depth[node] = depth[self.parent[node]] + 1
+        return depth
+
+    def walk(self, keep=None):
+        """Pre-order (node, depth, path) of all nodes below the root, path
+        being the list of frame names, shared and mutated between yields.
+        keep(node) False prunes the node with its subtree"""
+        offsets, kids = self.children()
+        depth = self.depths()
+        names, frame = self.names, self.frame
+        path = []
+        todo = list(kids[offsets[ROOT]:offsets[ROOT + 1]][::-1])
+        while todo:
+            node = todo.pop()
+            if keep is not None and not keep(node):
+                continue
+            d = depth[node]
+            del path[d - 1:]
+            path.append(names[frame[node]])
+            yield node, d, path
+            todo += kids[offsets[node]:offsets[node + 1]][::-1]
+
+def load(groups_files):
+    """StackTrie with one group per list of files, each list summed"""
+    trie = StackTrie(len(groups_files))
+    for group, files in enumerate(groups_files):
+        for path in files:
+            with open(path, errors="replace") as f:
+                trie.ingest(f, group)
+    if trie.skipped:
+        print(f"Warning: skipped {trie.skipped} malformed line(s)",
+              file=sys.stderr)
+    return trie
+
+def frame_stats(trie, group=0):
+    """{name: (self, total)}, total counted once per stack even when the
+    frame recurses"""
+    tot = trie.totals(group)
+    self_ = trie.self_[group]
+    res = {}
+    on_stack = [0] * len(trie.names)
+    fids = [] # frame ids of the current stack
+    for node, depth, _ in trie.walk():
+        for fid in fids[depth - 1:]:
+            on_stack[fid] -= 1
+        del fids[depth - 1:]
+        fid = trie.frame[node]
+        s, t = res.get(fid, (0, 0))
+        # a recursive frame's total is that of its outermost occurrence
+        res[fid] = (s + self_[node], t + (0 if on_stack[fid] else tot[node]))
+        on_stack[fid] += 1
+        fids.append(fid)
+    return {trie.names[fid]: st for fid, st in res.items()}
+
+def write_folded(trie, f, groups=(0,)):
+    """Folded lines of the nodes with self counts, one count column per
+    group, in cosim's 'a;b; count' format. Zero in every group is dropped;
+    counts of empty stacks (' count' lines) are kept as such"""
+    selfs = [trie.self_[g] for g in groups]
+    counts = [s[ROOT] for s in selfs]
+    if any(counts):
+        f.write(" " + " ".join(map(str, counts)) + "\n")
+    for node, _, path in trie.walk():
+        counts = [s[node] for s in selfs]
+        if any(counts):
+            f.write(";".join(path) + "; " + " ".join(map(str, counts)) + "\n")
+
+# svg
+def _color(name, delta=None):
+    if delta is None: # warm palette, stable per name
+        h = sum(name.encode()) % 64
+        return f"rgb({205 + h % 50},{(h * 37) % 180 + 40},{h % 55})"
+    # white at no change, saturating at +-100% of the frame's size
+    v = int(255 - min(abs(delta), 1.0) * 200)
+    return f"rgb(255,{v},{v})" if delta > 0 else f"rgb({v},{v},255)"
+
+def write_svg(trie, f, title, group=0, base_group=None):
+    """Flamegraph sized by group, colored by the change from base_group if
+    given. Frames narrower than MIN_W are left out with their subtrees"""
+    tot = trie.totals(group)
+    base = trie.totals(base_group) if base_group is not None else None
+    total = tot[ROOT]
+    scale = SVG_W / total if total else 0
+    x = [0.0] * len(trie) # left edge, children laid out left to right
+    cursor = {} # parent -> next free x
+    rects = []
+    max_depth = 0
+    for node, depth, path in trie.walk(lambda n: tot[n] * scale >= MIN_W):
+        p = trie.parent[node]
+        x[node] = cursor.get(p, x[p])
+        cursor[p] = x[node] + tot[node] * scale
+        max_depth = max(max_depth, depth)
+        name = path[-1]
+        info = f"{name} ({tot[node]:,} samples, {tot[node] / total:.2%}"
+        delta = None
+        if base is not None:
+            delta = (tot[node] - base[node]) / max(base[node], 1)
+            info += f", {delta:+.2%} vs A"
+        rects.append((x[node], depth, tot[node] * scale, name, info + ")",
+                      _color(name, delta)))
+
+    height = (max_depth + 3) * FRAME_H
+    f.write(f'<?xml version="1.0" standalone="no"?>\n'
+            f'<svg version="1.1" width="{SVG_W}" height="{height}" '
+            f'xmlns="http://www.w3.org/2000/svg">\n'
+            f'<style>text {{ font-family:Verdana; font-size:11px; }}</style>\n'
+            f'<text x="{SVG_W / 2}" y="{FRAME_H}" text-anchor="middle" '
+            f'font-size="15">{html.escape(title)}</text>\n')
+    for rx, depth, w, name, info, color in rects:
+        y = height - (depth + 1) * FRAME_H # root frames at the bottom
+        label = name if len(name) * 7 < w else name[:int(w / 7) - 2] + ".."
+        f.write(f'<g><title>{html.escape(info)}</title>'
+                f'<rect x="{rx:.2f}" y="{y}" width="{w:.2f}" '
+                f'height="{FRAME_H - 1}" fill="{color}" rx="2"/>')
+        if w > 21:
+            f.write(f'<text x="{rx + 3:.2f}" y="{y + FRAME_H - 4}">'
+                    f'{html.escape(label)}</text>')
+        f.write('</g>\n')
+    f.write("</svg>\n")
+
+def _open_out(path):
+    # stdout isn't closed at the end of the with block
+    return open(path, "w") if path != "-" else contextlib.nullcontext(sys.stdout)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Aggregate, diff and draw folded callstacks")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    t = sub.add_parser("top", help="Per-frame self and total counts")
+    t.add_argument("files", nargs="+", help="Folded stack files, summed")
+    t.add_argument("-n", "--num", type=int, default=20, help="Number of frames to print (default: 20)")
+    t.add_argument("-s", "--sort", choices=("self", "total"), default="self", help="Sort by self or total count (default: self)")
+    m = sub.add_parser("merge", help="Sum folded stack files into one")
+    m.add_argument("files", nargs="+", help="Folded stack files")
+    m.add_argument("-o", "--out", default="-", help="Merged folded output (default: stdout)")
+    m.add_argument("--svg", metavar="FILE", help="Also draw the merged flamegraph to FILE")
+    m.add_argument("--title", default="Flame Graph", help="Flamegraph title")
+    d = sub.add_parser("diff", help="Differential folded output (A vs B) and flamegraph")
+    d.add_argument("-a", nargs="+", required=True, metavar="FILE", help="Baseline folded stack files, summed")
+    d.add_argument("-b", nargs="+", required=True, metavar="FILE", help="Compared folded stack files, summed")
+    d.add_argument("-o", "--out", default="-", help="'stack count_a count_b' output (default: stdout)")
+    d.add_argument("-n", "--normalize", action="store_true", help="Scale A's counts to B's total first, to compare shape rather than size")
+    d.add_argument("--svg", metavar="FILE", help="Also draw the differential flamegraph to FILE")
+    d.add_argument("--title", default="Differential Flame Graph", help="Flamegraph title")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "top":
+        trie = load([args.files])
+        stats = frame_stats(trie)
+        total = trie.totals()[ROOT] or 1
+        key = 0 if args.sort == "self" else 1
+        w = max([len("frame")] + [len(n) for n in stats])
+        print(f"{'frame':<{w}}  {'self':>12}  {'self%':>7}  " +
+              f"{'total':>12}  {'total%':>7}")
+        for name, (s, t) in sorted(stats.items(),
+                                   key=lambda kv: -kv[1][key])[:args.num]:
+            print(f"{name:<{w}}  {s:>12,}  {s / total:>7.2%}  " +
+                  f"{t:>12,}  {t / total:>7.2%}")
+        return
+
+    if args.cmd == "merge":
+        trie = load([args.files])
+        with _open_out(args.out) as f:
+            write_folded(trie, f)
+        if args.svg:
+            with open(args.svg, "w") as f:
+                write_svg(trie, f, args.title)
+        return
+
+    trie = load([args.a, args.b])
+    if args.normalize:
+        tot_a, tot_b = trie.totals(0)[ROOT], trie.totals(1)[ROOT]
+        if tot_a:
+            a = trie.self_[0]
+            for i in range(len(a)):
+                a[i] = round(a[i] * tot_b / tot_a)
+    with _open_out(args.out) as f:
+        write_folded(trie, f, groups=(0, 1))
+    if args.svg:
+        with open(args.svg, "w") as f:
+            write_svg(trie, f, args.title, group=1, base_group=0)
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,17 @@
 
 import argparse
 import json
+import re
 import sys
 from pathlib import Path
 
+import hw_stats_store
+
+# 'workload: <name>' line flash_bit.tcl appends to the UART capture (uart_log)
+# before flashing each workload, identifies its counters wherever they are in
+# the log; untagged logs fall back to WORKLOADS order
+TAG_RE = re.compile(r"^\W*workload\s*[:=]\s*([\w.+-]+)", re.IGNORECASE)
+
 # matching the order in flash_bit.tcl
 WORKLOADS = [
     "dhrystone",
@@ -50,31 +58,89 @@ WORKLOADS = [
     "ustress_mul64",
 ]
 
-def parse_odd_jsons(path: Path) -> list[dict]:
+def scan_log(path: Path) -> tuple[dict, list, int]:
     """
-    Return every odd-numbered JSON dict found in *path*.
-
-    A line is considered a JSON object when it starts with '{'.
-    Counter starts at 1; odd positions (1, 3, 5, …) are collected.
+    Stream the counter dicts out of the UART log *path*, line by line.
+
+    Returns (tagged, positional, corrupt):
+      tagged     - {workload: counters}, the first of the two dicts after a
+                   'workload: <name>' line (none if either is lost), or a dict
+                   with a "workload" key; the last run wins in repeated
+                   captures
+      positional - counters from an untagged log, every odd dict in order as
+                   before, None where the line was garbled so later workloads
+                   keep their position
+      corrupt    - number of lines that looked like a dict but didn't parse
     """
 
-    results = []
-    json_counter = 0
-    with path.open() as fh:
+    decoder = json.JSONDecoder()
+    tagged, positional, corrupt = {}, [], 0
+    tag, pos = None, 0 # current tag, dicts seen since the tag (or start)
+    counters = None # first dict after the tag
+
+    def close_tag():
+        # a workload prints two dicts, with only one the counters line may be
+        # the one that got lost and the other dict would pass for it
+        if tag is None:
+            return
+        if pos >= 2 and counters is not None:
+            tagged[tag] = counters
+        elif pos == 1:
+            print(f"WARNING: {path}: '{tag}' has a single dict, skipping it",
+                  file=sys.stderr)
+
+    with path.open(errors="replace") as fh: # UART noise isn't valid utf-8
         for lineno, line in enumerate(fh, 1):
-            stripped = line.strip()
-            if not stripped.startswith("{"):
+            m = TAG_RE.match(line)
+            if m:
+                close_tag()
+                tag, pos, counters = m.group(1), 0, None
+                continue
+            start = line.find("{") # tolerate noise before the dict
+            if start < 0:
+                continue
+            pos += 1
+            try:
+                d, _ = decoder.raw_decode(line, start)
+                if not isinstance(d, dict):
+                    raise ValueError("not a dict")
+            except ValueError as exc:
+                corrupt += 1
+                print(f"WARNING: {path}:{lineno}: skipping garbled line " +
+                      f"({exc}): {line.strip()[:60]!r}", file=sys.stderr)
+                if tag is None and pos % 2 == 1:
+                    positional.append(None)
                 continue
-            json_counter += 1
-            if json_counter % 2 == 1:  # odd
-                try:
-                    results.append(json.loads(stripped))
-                except json.JSONDecodeError as exc:
-                    sys.exit(
-                        f"ERROR: JSON parse failure in {path}:{lineno}: {exc}\n"
-                        f"  Line: {stripped!r}"
-                    )
-    return results
+            name = d.pop("workload", None)
+            if name is not None:
+                tagged[name] = d
+            elif tag is not None and pos == 1:
+                counters = d
+            elif tag is None and pos % 2 == 1:
+                positional.append(d)
+    close_tag()
+    return tagged, positional, corrupt
+
+def load_counters(path: Path) -> dict:
+    """
+    {workload: counters} from the UART log *path*, by tags when the log has
+    them, else by position in WORKLOADS (which needs exactly one odd dict per
+    workload, as the flash order can't be checked otherwise)
+    """
+
+    tagged, positional, corrupt = scan_log(path)
+    if corrupt:
+        print(f"WARNING: {corrupt} garbled line(s) skipped in {path}",
+              file=sys.stderr)
+    if tagged:
+        return tagged
+    n = len(WORKLOADS)
+    if len(positional) != n:
+        sys.exit(
+            f"ERROR: untagged log, expected {n} odd JSON dicts, "
+            f"got {len(positional)}.\n  Check {path}"
+        )
+    return {w: d for w, d in zip(WORKLOADS, positional) if d is not None}
 
 def main() -> None:
     #script_dir = Path(__file__).parent
@@ -83,6 +149,8 @@ def main() -> None:
     parser.add_argument("--tda", type=Path, default=cwd / "output_raw_tda.log", help="TDA counter log (default: output_raw_tda.log next to this script)")
     parser.add_argument("--hw", type=Path, default=cwd / "output_raw_hw.log", help="HW counter log (default: output_raw_hw.log next to this script)")
     parser.add_argument("--outdir", type=Path, default=cwd, help="Output directory for per-workload JSON files (default: script directory)")
+    parser.add_argument("--run", help="Also ingest the TDA and HW counters into the hw_stats store under this run id, e.g. commit hash")
+    parser.add_argument("--store", default=hw_stats_store.STORE_FILE, help=f"hw_stats store for --run (default: {hw_stats_store.STORE_FILE})")
     args = parser.parse_args()
 
     tda_path = args.tda
@@ -95,22 +163,14 @@ def main() -> None:
 
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    tda_dicts = parse_odd_jsons(tda_path)
-    hw_dicts = parse_odd_jsons(hw_path)
+    tda_dicts = load_counters(tda_path)
+    hw_dicts = load_counters(hw_path)
 
-    n = len(WORKLOADS)
-    if len(tda_dicts) != n:
-        sys.exit(
-            f"ERROR: expected {n} odd JSON dicts in TDA log, "
-            f"got {len(tda_dicts)}.\n  Check {tda_path}"
-        )
-    if len(hw_dicts) != n:
-        sys.exit(
-            f"ERROR: expected {n} odd JSON dicts in HW log, "
-            f"got {len(hw_dicts)}.\n  Check {hw_path}"
-        )
+    # known workloads in flash order, then any others the logs are tagged with
+    names = [w for w in WORKLOADS if w in tda_dicts or w in hw_dicts]
+    names += sorted((set(tda_dicts) | set(hw_dicts)) - set(WORKLOADS))
 
-    col_w = max(len(w) for w in WORKLOADS)
+    col_w = max(len(w) for w in names + WORKLOADS)
     print(
         f"{'Workload':<{col_w}}"
         f"  {'cycles(tda)':>14}"
@@ -119,7 +179,15 @@ def main() -> None:
     )
     print("-" * (col_w + 48))
 
-    for name, tda, hw in zip(WORKLOADS, tda_dicts, hw_dicts):
+    written, missing = 0, []
+    for name in names:
+        tda, hw = tda_dicts.get(name), hw_dicts.get(name)
+        if tda is None or hw is None:
+            side = "TDA" if tda is None else "HW"
+            print(f"{name:<{col_w}}  {'missing in ' + side + ' log':>44}")
+            missing.append(name)
+            continue
+
         # merge: TDA entries first, then HW entries that are not already present
         merged = dict(tda)
         merged.update({k: v for k, v in hw.items() if k not in merged})
@@ -134,9 +202,25 @@ def main() -> None:
         with out_path.open("w") as fh:
             json.dump({"core": merged}, fh, indent=4)
             fh.write("\n")
+        written += 1
 
     print("-" * (col_w + 48))
-    print(f"Wrote {n} JSON files to {out_dir}")
+    print(f"Wrote {written} JSON files to {out_dir}")
+    if args.run:
+        # UART dicts are the core section of hw_stats
+        cols = hw_stats_store.load(args.store)
+        hw_stats_store.add(cols, [
+            ((name, args.run, source), {"core": d})
+            for source, dicts in (("tda", tda_dicts), ("hw", hw_dicts))
+            for name, d in dicts.items()])
+        hw_stats_store.save(cols, args.store)
+        print(f"Ingested run {args.run} into {args.store}")
+    not_seen = [w for w in WORKLOADS if w not in names]
+    if not_seen:
+        print(f"Not in either log: {', '.join(not_seen)}")
+    if missing:
+        sys.exit(f"ERROR: {len(missing)} workload(s) missing in one log: " +
+                 ", ".join(missing))
 
 if __name__ == "__main__":
     main()
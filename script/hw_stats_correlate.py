@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Counter correlation between two hw_stats sources across a suite
+
+Compares every counter two sources of the hw_stats store share, per workload,
+e.g. the cosim perf model against the FPGA UART dumps. For each counter (and
+each derived metric: ipc, cpi, hit rates, MPKI, bp_acc) it reports the
+relative difference per workload, (est - ref) / ref in %, as in the
+perf_est_correlation_*.png plots, and the Pearson correlation across the
+suite.
+
+Without a baseline, counters off by more than --max_err on any workload are
+flagged. A baseline saved from a known good comparison flags drift instead:
+per-workload differences that moved by more than --max_drift, or correlation
+that dropped by more than --max_corr_drop, so an existing, understood gap
+doesn't hide a new one. Flagged counters make the script exit nonzero:
+
+    hw_stats_correlate.py -r 683a74f --save_baseline corr_base.json
+    hw_stats_correlate.py -r 9b1c2d0 --baseline corr_base.json
+"""
+
+import argparse
+import json
+import math
+import re
+import statistics
+import sys
+
+import hw_stats_store
+
+BASELINE_FORMAT = "hw_stats_corr/1"
+
+def _pairs(cols, run, source, workload):
+    """{workload: row} of the source's rows in run"""
+    idx = hw_stats_store.select(cols, workload, re.escape(run),
+                                re.escape(source))
+    return {cols["workload"][i]: i for i in idx}
+
+def _rel_err(est, ref):
+    if ref == 0:
+        return 0.0 if est == 0 else math.inf
+    return (est - ref) / ref * 100
+
+def _corr(xs, ys):
+    try:
+        return statistics.correlation(xs, ys)
+    except statistics.StatisticsError: # fewer than 2 workloads or constant
+        return math.nan
+
+def correlate(cols, ref, est, workload=None, counter=None):
+    """{counter: {"corr", "rel_err": {workload: %}}} over the workloads both
+    (source, run) refs have, for counters present in both on every one of
+    them. ref and est are (source, run) tuples"""
+    ref_rows = _pairs(cols, ref[1], ref[0], workload)
+    est_rows = _pairs(cols, est[1], est[0], workload)
+    names = sorted(set(ref_rows) & set(est_rows))
+    ri = [ref_rows[w] for w in names]
+    ei = [est_rows[w] for w in names]
+    src = {**{c: v for c, v in cols.items() if c not in hw_stats_store.KEYS},
+           **hw_stats_store.derive(cols)}
+    counter_re = re.compile(counter) if counter else None
+
+    res = {}
+    for c, v in src.items():
+        if counter_re and not counter_re.search(c):
+            continue
+        rv = [v[i] for i in ri]
+        ev = [v[i] for i in ei]
+        if not names or any(math.isnan(x) for x in rv + ev):
+            continue # not shared
+        res[c] = {
+            "corr": _corr(rv, ev),
+            "rel_err": {w: _rel_err(e, r) for w, r, e in zip(names, rv, ev)},
+        }
+    return res
+
+def flag(res, baseline=None, max_err=5.0, max_drift=1.0, max_corr_drop=0.01):
+    """{counter: [reasons]} of the counters out of bounds, against the
+    baseline's counters when given, else against max_err"""
+    flagged = {}
+    for c, r in res.items():
+        reasons = []
+        base = (baseline or {}).get(c)
+        if baseline is None:
+            reasons += [f"{w} {e:+.2f}%" for w, e in r["rel_err"].items()
+                        if not abs(e) <= max_err]
+        elif base is not None: # counters new since the baseline aren't drift
+            for w, e in r["rel_err"].items():
+                b = base["rel_err"].get(w)
+                if b is None or b == e: # also inf == inf
+                    continue
+                if not abs(e - b) <= max_drift:
+                    reasons.append(f"{w} {b:+.2f}% -> {e:+.2f}%")
+            if base["corr"] - r["corr"] > max_corr_drop:
+                reasons.append(f"corr {base['corr']:.4f} -> {r['corr']:.4f}")
+        if reasons:
+            flagged[c] = reasons
+    if baseline is not None:
+        for c in sorted(set(baseline) - set(res)):
+            flagged[c] = ["no longer shared"]
+    return flagged
+
+def save_baseline(path, res, ref, est):
+    with open(path, "w") as f:
+        json.dump({"format": BASELINE_FORMAT, "ref": list(ref),
+                   "est": list(est), "counters": res}, f, indent=1)
+
+def load_baseline(path):
+    with open(path) as f:
+        base = json.load(f)
+    if base.get("format") != BASELINE_FORMAT:
+        sys.exit(f"error: {path} is not a {BASELINE_FORMAT} baseline")
+    return base["counters"]
+
+def print_summary(res, flagged):
+    if not res:
+        print("no shared counters")
+        return
+    w = max(len("counter"), *(len(c) for c in res))
+    print(f"{'counter':<{w}}  {'corr':>7}  {'mean|err|%':>10}  " +
+          f"{'max|err|%':>10}  worst")
+    for c, r in res.items():
+        errs = r["rel_err"]
+        worst = max(errs, key=lambda k: abs(errs[k]))
+        mean = statistics.fmean(abs(e) for e in errs.values())
+        mark = ""
+        if c in flagged:
+            reasons = flagged[c]
+            more = f"; +{len(reasons) - 3} more" if len(reasons) > 3 else ""
+            mark = "  <- " + "; ".join(reasons[:3]) + more
+        print(f"{c:<{w}}  {r['corr']:>7.4f}  {mean:>10.2f}  " +
+              f"{abs(errs[worst]):>10.2f}  {worst}{mark}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Correlate the counters two hw_stats sources share across workloads, flag drift")
+    parser.add_argument("--store", default=hw_stats_store.STORE_FILE, help=f"hw_stats store (default: {hw_stats_store.STORE_FILE})")
+    parser.add_argument("-r", "--run", help="Run id of both sources")
+    parser.add_argument("--ref", default="hw", choices=hw_stats_store.SOURCES, help="Reference source (default: hw)")
+    parser.add_argument("--est", default="cosim", choices=hw_stats_store.SOURCES, help="Source compared to the reference (default: cosim)")
+    parser.add_argument("--ref_run", help="Run id of the reference source, if not --run")
+    parser.add_argument("--est_run", help="Run id of the compared source, if not --run")
+    parser.add_argument("-w", "--workload", help="Regex on workload names (default: all shared)")
+    parser.add_argument("-c", "--counter", help="Regex searched in counter names (default: all shared)")
+    parser.add_argument("--max_err", type=float, default=5.0, help="Without a baseline, flag counters off by more than this %% on any workload (default: 5)")
+    parser.add_argument("--baseline", metavar="FILE", help="Flag drift against this baseline instead")
+    parser.add_argument("--max_drift", type=float, default=1.0, help="With --baseline, flag per-workload differences that moved by more than this many %% points (default: 1)")
+    parser.add_argument("--max_corr_drop", type=float, default=0.01, help="With --baseline, flag correlation drops larger than this (default: 0.01)")
+    parser.add_argument("--save_baseline", metavar="FILE", help="Save this comparison as a baseline")
+    parser.add_argument("--json", metavar="FILE", help="Write the per-workload differences and flags to FILE")
+    args = parser.parse_args()
+    args.ref_run = args.ref_run or args.run
+    args.est_run = args.est_run or args.run
+    if not args.ref_run or not args.est_run:
+        parser.error("needs --run, or both --ref_run and --est_run")
+    return args
+
+def main():
+    args = parse_args()
+    ref, est = (args.ref, args.ref_run), (args.est, args.est_run)
+    cols = hw_stats_store.load(args.store)
+    res = correlate(cols, ref, est, args.workload, args.counter)
+    if not res:
+        sys.exit("error: no workloads with counters in both " +
+                 f"{ref[0]}@{ref[1]} and {est[0]}@{est[1]}")
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    if baseline and args.counter:
+        baseline = {c: b for c, b in baseline.items()
+                    if re.search(args.counter, c)}
+    flagged = flag(res, baseline, args.max_err, args.max_drift,
+                   args.max_corr_drop)
+
+    n = len(next(iter(res.values()))["rel_err"])
+    print(f"{est[0]}@{est[1]} vs {ref[0]}@{ref[1]}: {n} workloads, " +
+          f"{len(res)} shared counters")
+    print_summary(res, flagged)
+    for c in flagged:
+        if c not in res:
+            print(f"{c}: {'; '.join(flagged[c])}")
+    if args.save_baseline:
+        save_baseline(args.save_baseline, res, ref, est)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"counters": res, "flagged": flagged}, f, indent=1)
+    if flagged:
+        sys.exit(f"{len(flagged)} counter(s) flagged")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""Columnar store of perf counters (hw_stats) across runs
+
+Every hw_stats dict (core, icache, dcache, bpred sections) is flattened into
+dotted columns, e.g. core.cycles or icache.hits.all, and stored as one row
+keyed by (workload, run, source), source being where the counters came from:
+tda, hw (FPGA UART logs) or cosim. Ingesting a row with an existing key
+replaces it.
+
+The store is a single binary file: a JSON header line with the key strings and
+column names, then each column as a raw array (int32 codes for the keys,
+float64 for counters, NaN where a source doesn't have the counter), so loading
+thousands of rows is a few reads instead of parsing thousands of JSONs. The
+usual metrics (ipc, cpi, hit rates, MPKI, branch prediction accuracy) are
+derived per column on query, with the names of the hw_stats_*.csv tables:
+
+    hw_stats_store.py ingest -r 683a74f -s hw all_stats/*_hw_stats.json
+    hw_stats_store.py query -w "embench_.*" -f ipc li1_mpki bp_acc
+"""
+
+import argparse
+import array
+import csv
+import json
+import math
+import os
+import re
+import sys
+
+STORE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ".hw_stats_store.bin")
+STORE_FORMAT = "hw_stats_store/1"
+KEYS = ("workload", "run", "source")
+SOURCES = ("tda", "hw", "cosim")
+NAN = float("nan")
+# per-workload files: <workload>_hw_stats.json, get_run_stats.py's merged
+# <workload>_raw.json, or hw_stats.json in a run dir named after the workload
+STATS_FILE_RE = re.compile(r"^(?P<workload>.+?)_(hw_stats|raw)\.json$")
+
+def flatten(stats, prefix=""):
+    """{dotted.name: float} of the numeric counters in a nested hw_stats dict,
+    strings (e.g. bpred type) and markers like _done are dropped"""
+    res = {}
+    for k, v in stats.items():
+        if k.startswith("_"):
+            continue
+        name = prefix + k
+        if isinstance(v, dict):
+            res.update(flatten(v, name + "."))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            res[name] = float(v)
+    return res
+
+def workload_of(path):
+    m = STATS_FILE_RE.match(os.path.basename(path))
+    if m:
+        return m.group("workload")
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+# store
+def empty():
+    return {k: [] for k in KEYS}
+
+def rows(cols):
+    return len(cols[KEYS[0]])
+
+def load(path=STORE_FILE):
+    """{column: values}, lists of str for KEYS and float64 arrays for the
+    counters, an empty store if there's none yet"""
+    if not os.path.isfile(path):
+        return empty()
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != STORE_FORMAT:
+            sys.exit(f"error: {path} is not a {STORE_FORMAT} store")
+        data = memoryview(f.read())
+    swap = header["byteorder"] != sys.byteorder
+    n, off = header["rows"], 0
+    cols = {}
+    def _take(typecode):
+        nonlocal off
+        a = array.array(typecode)
+        a.frombytes(data[off:off + n * a.itemsize])
+        off += n * a.itemsize
+        if swap:
+            a.byteswap()
+        return a
+    for k in KEYS:
+        strings = header["keys"][k]
+        cols[k] = [strings[i] for i in _take("i")]
+    for name in header["columns"]:
+        cols[name] = _take("d")
+    return cols
+
+def save(cols, path=STORE_FILE):
+    header = {"format": STORE_FORMAT, "byteorder": sys.byteorder,
+              "rows": rows(cols), "keys": {},
+              "columns": sorted(c for c in cols if c not in KEYS)}
+    chunks = []
+    for k in KEYS:
+        strings = sorted(set(cols[k]))
+        code = {s: i for i, s in enumerate(strings)}
+        header["keys"][k] = strings
+        chunks.append(array.array("i", (code[s] for s in cols[k])).tobytes())
+    for name in header["columns"]:
+        chunks.append(cols[name].tobytes())
+    # rename into place, a query may be reading it
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(json.dumps(header).encode() + b"\n")
+        for c in chunks:
+            f.write(c)
+    os.replace(tmp, path)
+
+def add(cols, entries):
+    """Set the rows of entries [((workload, run, source), stats)] to the
+    flattened stats, appending the keys that aren't stored yet"""
+    index = {k: i for i, k in enumerate(zip(*(cols[k] for k in KEYS)))}
+    for key, stats in entries:
+        flat = flatten(stats)
+        n = rows(cols)
+        for name in flat:
+            if name not in cols:
+                cols[name] = array.array("d", [NAN]) * n
+        idx = index.get(tuple(key))
+        if idx is None:
+            index[tuple(key)] = n
+            for k, v in zip(KEYS, key):
+                cols[k].append(v)
+        for name in cols:
+            if name in KEYS:
+                continue
+            if idx is None:
+                cols[name].append(flat.get(name, NAN))
+            else:
+                cols[name][idx] = flat.get(name, NAN)
+
+def select(cols, workload=None, run=None, source=None):
+    """Row indices whose keys match the given regexes (fullmatch)"""
+    pats = [(k, re.compile(p)) for k, p in
+            zip(KEYS, (workload, run, source)) if p is not None]
+    return [i for i in range(rows(cols))
+            if all(p.fullmatch(cols[k][i]) for k, p in pats)]
+
+# derived metrics
+def _col(cols, *names):
+    """first of names present in each row, FPGA and cosim name some
+    counters differently"""
+    n = rows(cols)
+    res = array.array("d", [NAN]) * n
+    for name in reversed(names):
+        if name in cols:
+            res = array.array("d", (b if a != a else a
+                                    for a, b in zip(cols[name], res)))
+    return res
+
+def _div(num, den, scale=1.0):
+    return array.array("d", (n / d * scale if d else NAN
+                             for n, d in zip(num, den)))
+
+def derive(cols):
+    """{metric: float64 array} of the derived columns for all rows"""
+    cycles = _col(cols, "core.cycles")
+    inst = _col(cols, "core.ret_inst", "core.ret")
+    l1i_ref = _col(cols, "core.l1i_ref", "icache.references")
+    l1i_miss = _col(cols, "core.l1i_miss", "icache.misses.all")
+    l1d_ref = _col(cols, "core.l1d_ref", "dcache.references")
+    l1d_miss = _col(cols, "core.l1d_miss", "dcache.misses.all")
+    br = _col(cols, "core.ret_ctrl_flow_br", "bpred.branches")
+    bp_miss = _col(cols, "core.bp_miss", "bpred.mispredicted")
+    return {
+        "ipc": _div(inst, cycles),
+        "cpi": _div(cycles, inst),
+        "li1_hr": _div([r - m for r, m in zip(l1i_ref, l1i_miss)], l1i_ref, 100),
+        "li1_mpki": _div(l1i_miss, inst, 1000),
+        "ld1_hr": _div([r - m for r, m in zip(l1d_ref, l1d_miss)], l1d_ref, 100),
+        "ld1_mpki": _div(l1d_miss, inst, 1000),
+        "bp_acc": _div([b - m for b, m in zip(br, bp_miss)], br, 100),
+        "bp_mpki": _div(bp_miss, inst, 1000),
+    }
+
+def table(cols, idx, fields):
+    """[{field: value}] of rows idx, fields from the stored and derived
+    columns"""
+    derived = derive(cols)
+    src = {**cols, **derived}
+    missing = [f for f in fields if f not in src]
+    if missing:
+        sys.exit(f"error: unknown column(s): {', '.join(missing)}")
+    return [{f: src[f][i] for f in fields} for i in idx]
+
+def _fmt(v):
+    if isinstance(v, str):
+        return v
+    if math.isnan(v):
+        return "-"
+    return f"{v:.0f}" if v == int(v) and abs(v) >= 1000 else f"{v:.3f}"
+
+def print_table(rows_, fields):
+    if not rows_:
+        print("no matching rows")
+        return
+    cells = [[_fmt(r[f]) for f in fields] for r in rows_]
+    widths = [max(len(f), *(len(c[i]) for c in cells))
+              for i, f in enumerate(fields)]
+    print("  ".join(f"{f:>{w}}" for f, w in zip(fields, widths)))
+    for c in cells:
+        print("  ".join(f"{v:>{w}}" for v, w in zip(c, widths)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Columnar store of hw_stats perf counters across runs")
+    parser.add_argument("--store", default=STORE_FILE, help=f"Store file (default: {STORE_FILE})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("ingest", help="Add hw_stats JSON files to the store")
+    p.add_argument("files", nargs="+", help="<workload>_hw_stats.json, <workload>_raw.json or <workload>/hw_stats.json files")
+    p.add_argument("-r", "--run", required=True, help="Run id, e.g. commit hash or date")
+    p.add_argument("-s", "--source", required=True, choices=SOURCES, help="Where the counters come from")
+    p.add_argument("-w", "--workload", help="Workload name, instead of the one from the file path (single file only)")
+    q = sub.add_parser("query", help="Print or export rows from the store")
+    q.add_argument("-w", "--workload", help="Regex on workload names")
+    q.add_argument("-r", "--run", help="Regex on run ids")
+    q.add_argument("-s", "--source", help="Regex on sources")
+    q.add_argument("-f", "--fields", nargs="+", default=["ipc", "li1_mpki", "ld1_mpki", "bp_acc"], help="Stored (e.g. core.cycles) or derived columns to print after the keys")
+    q.add_argument("--sort", help="Column to sort by (default: store order)")
+    q.add_argument("--columns", action="store_true", help="List the stored and derived columns instead")
+    q.add_argument("--csv", metavar="FILE", help="Write the printed columns of the matching rows to FILE")
+    args = parser.parse_args()
+    if args.cmd == "ingest" and args.workload and len(args.files) > 1:
+        parser.error("--workload needs a single file")
+    return args
+
+def main():
+    args = parse_args()
+    cols = load(args.store)
+    if args.cmd == "ingest":
+        entries = []
+        for path in args.files:
+            with open(path) as f:
+                stats = json.load(f)
+            key = (args.workload or workload_of(path), args.run, args.source)
+            entries.append((key, stats))
+        add(cols, entries)
+        save(cols, args.store)
+        print(f"Ingested {len(args.files)} file(s), " +
+              f"{rows(cols)} rows in {args.store}")
+        return
+
+    if args.columns:
+        print("\n".join(sorted(c for c in cols if c not in KEYS)))
+        print("\n".join(derive(empty())))
+        return
+    idx = select(cols, args.workload, args.run, args.source)
+    fields = list(KEYS) + [f for f in args.fields if f not in KEYS]
+    rows_ = table(cols, idx, fields)
+    if args.sort:
+        if args.sort not in fields:
+            sys.exit(f"error: can only sort by a printed column: {args.sort}")
+        # NaN last
+        rows_.sort(key=lambda r: (r[args.sort] != r[args.sort], r[args.sort]))
+    print_table(rows_, fields)
+    if args.csv and rows_:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(rows_)
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,113 @@
 #!/usr/bin/env python3
 """Parse a Vivado-style -prj filelist (e.g. filelist/sources_sim.f) for Make
 
-Usage: parse_filelist.py <design|verif|include-dirs|defines|worklib> <filelist>
+Usage: parse_filelist.py <design|verif|include-dirs|defines|worklib|all> <filelist>
+
+'all' prints every mode in one call as 'mode:token' words, for make to split
+with $(filter)/$(patsubst). Python callers import parse() instead of running
+the script. Results are cached on disk, keyed by the filelist's path, mtime
+and size, and the values of the env vars it references.
 """
 
+import json
 import os
+import re
 import shlex
 import sys
 
 MODES = ('design', 'verif', 'include-dirs', 'defines', 'worklib')
+CACHE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ".filelist_cache.json")
+# $VAR and ${VAR}, as os.path.expandvars
+VAR_RE = re.compile(r'\$(\w+|\{[^}]*\})')
 
-def main():
-    if len(sys.argv) != 3:
-        sys.exit(f'usage: {sys.argv[0]} <{"|".join(MODES)}> <filelist>')
-
-    mode, filelist = sys.argv[1], sys.argv[2]
-    if mode not in MODES:
-        sys.exit(f'unknown mode: {mode} (expected one of: {", ".join(MODES)})')
-    if not os.path.isfile(filelist):
-        sys.exit(f'no such file: {filelist}')
+def _expandvars(s, env):
+    def sub(m):
+        name = m.group(1).strip('{}')
+        return env.get(name, m.group(0)) # unknown vars are left as-is
+    return VAR_RE.sub(sub, s)
 
-    content = open(filelist).read().replace('\\\n', ' ')
+def _parse(filelist, env):
+    with open(filelist) as f:
+        content = f.read().replace('\\\n', ' ')
     tokens = shlex.split(content)
     _file_type, worklib, *rest = tokens
 
-    design, verif, include_dirs, defines = [], [], [], []
+    res = {mode: [] for mode in MODES}
+    res['worklib'] = [worklib]
     i = 0
     while i < len(rest):
         tok = rest[i]
         if tok in ('-d', '--define'):
-            defines.append(rest[i + 1])
+            res['defines'].append(rest[i + 1])
             i += 2
         elif tok in ('-i', '--include'):
-            include_dirs.append(os.path.expandvars(rest[i + 1]))
+            res['include-dirs'].append(_expandvars(rest[i + 1], env))
             i += 2
         else:
-            p = os.path.expandvars(tok)
+            p = _expandvars(tok, env)
             # relies on project structure where `src` is the RTL sources dir
             # everything else by default falls under verification sources
-            (design if '/src/' in p else verif).append(p)
+            res['design' if '/src/' in p else 'verif'].append(p)
             i += 1
 
-    if mode == 'design':
-        print(' '.join(design))
-    elif mode == 'verif':
-        print(' '.join(verif))
-    elif mode == 'include-dirs':
-        print(' '.join(include_dirs))
-    elif mode == 'defines':
-        print(' '.join(defines))
-    elif mode == 'worklib':
-        print(worklib)
+    env_vars = sorted({m.group(1).strip('{}') for m in VAR_RE.finditer(content)})
+    return res, env_vars
+
+# cache
+def _load_cache():
+    try:
+        with open(CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_cache(cache):
+    # rename into place, parallel make/run_test invocations may race
+    tmp = f'{CACHE_FILE}.tmp{os.getpid()}'
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, CACHE_FILE)
+    except OSError: # read-only checkout, just don't cache
+        pass
+
+def parse(filelist, env=None):
+    """{mode: [tokens]} for all MODES, worklib is a one-item list.
+    env is used for $VAR expansion, os.environ by default"""
+    env = os.environ if env is None else env
+    path = os.path.abspath(filelist)
+    st = os.stat(path)
+    stamp = [st.st_mtime_ns, st.st_size]
+
+    cache = _load_cache()
+    hit = cache.get(path)
+    if hit and hit['stamp'] == stamp and \
+    all(env.get(k) == v for k, v in hit['env'].items()):
+        return hit['modes']
+
+    res, env_vars = _parse(path, env)
+    cache[path] = {'stamp': stamp, 'modes': res,
+                   'env': {k: env.get(k) for k in env_vars}}
+    _save_cache(cache)
+    return res
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit(f'usage: {sys.argv[0]} <{"|".join(MODES + ("all",))}> <filelist>')
+
+    mode, filelist = sys.argv[1], sys.argv[2]
+    if mode not in MODES + ('all',):
+        sys.exit(f'unknown mode: {mode} (expected one of: {", ".join(MODES + ("all",))})')
+    if not os.path.isfile(filelist):
+        sys.exit(f'no such file: {filelist}')
+
+    res = parse(filelist)
+    if mode == 'all':
+        print(' '.join(f'{m}:{tok}' for m in MODES for tok in res[m]))
+    else:
+        print(' '.join(res[mode]))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,89 @@
+"""Performance regression gate of a run_test.py run directory
+
+After a suite, the cosim hw_stats.json of each test is reduced to a few
+lower-is-better metrics (cycles, cpi, L1I and L1D MPKI) and compared with a
+baseline file of {test_name: {metric: value}}. A functionally passing test
+whose metric got worse than its tolerance allows is PERF-REGRESSED and fails
+the suite. Tests without a baseline entry or without hw_stats.json are only
+reported. The baseline is (re)written from a run's passing tests on request,
+and is meant to be committed next to the testlist it gates.
+"""
+
+import glob
+import json
+import os
+
+from script import hw_stats_store
+
+PERF_REGRESSED = "PERF-REGRESSED"
+HW_STATS = "hw_stats.json"
+COSIM_OUT_SUFFIX = "_out_cosim" # cosim output dir: <test_name>_out_cosim
+# allowed increase over the baseline, in % of the baseline value
+TOLERANCES = {"cycles": 1.0, "cpi": 1.0, "li1_mpki": 5.0, "ld1_mpki": 5.0}
+# absolute slack, MPKI near 0 would otherwise regress on a single miss
+SLACK = {"li1_mpki": 0.01, "ld1_mpki": 0.01}
+
+def find_hw_stats(test_dir, test_name):
+    """Path of the test's cosim hw_stats.json, None if it didn't write one"""
+    path = os.path.join(test_dir, test_name + COSIM_OUT_SUFFIX, HW_STATS)
+    if os.path.isfile(path):
+        return path
+    found = glob.glob(os.path.join(test_dir, "*" + COSIM_OUT_SUFFIX, HW_STATS))
+    return found[0] if found else None
+
+def metrics(hw_stats_path):
+    """{metric: value} of TOLERANCES metrics, None for unreadable stats"""
+    try:
+        with open(hw_stats_path) as f:
+            stats = json.load(f)
+    except (OSError, ValueError): # partial file of a killed simulation
+        return None
+    cols = hw_stats_store.empty()
+    hw_stats_store.add(cols, [(("", "", ""), stats)])
+    derived = hw_stats_store.derive(cols)
+    src = {"cycles": cols.get("core.cycles", [float("nan")]), **derived}
+    res = {m: src[m][0] for m in TOLERANCES}
+    return {m: v for m, v in res.items() if v == v} # NaN: not in these stats
+
+def parse_tolerances(items):
+    """TOLERANCES updated with METRIC=PCT items"""
+    tol = dict(TOLERANCES)
+    for item in items or []:
+        metric, sep, pct = item.partition("=")
+        if not sep or metric not in TOLERANCES:
+            raise ValueError(f"Invalid perf tolerance '{item}', expected " +
+                             f"METRIC=PCT with METRIC one of " +
+                             f"{', '.join(TOLERANCES)}")
+        tol[metric] = float(pct)
+    return tol
+
+def compare(current, baseline, tolerances=TOLERANCES):
+    """[(metric, base, current, change %)] of the metrics worse than the
+    baseline by more than their tolerance"""
+    regressed = []
+    for m, tol in tolerances.items():
+        if m not in current or m not in baseline:
+            continue
+        base, cur = baseline[m], current[m]
+        if cur - base > max(abs(base) * tol / 100, SLACK.get(m, 0)):
+            pct = (cur - base) / base * 100 if base else float("inf")
+            regressed.append((m, base, cur, pct))
+    return regressed
+
+def format_regression(regressed):
+    return "; ".join(f"{m} {base:g} -> {cur:g} ({pct:+.2f}%)"
+                     for m, base, cur, pct in regressed)
+
+def load_baseline(path):
+    """{test_name: {metric: value}}, empty if there's no baseline yet"""
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(path, baseline):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
@@ -0,0 +1,161 @@
+"""Per-test runtime history and longest-expected-first scheduling for run_test.py
+
+History is a small JSON map of test path (relative to REPO_ROOT) to a smoothed
+wall-clock runtime, updated after every suite. Tests without history fall back
+to the 'Simulation runtime' line of a previous test.log, then to the median of
+the known tests. Waveform, coverage and kanata logging slow xsim down several
+times, so runs with any of them are kept apart under 'path#mode' keys and
+never mix into the plain runtimes and simulation rate.
+
+The same data bounds each test's wall clock: a simulation running well past
+its expected runtime, or past the time TIMEOUT_CLOCKS take at the measured
+simulation rate, is assumed hung and killed by run_test.py.
+"""
+
+import heapq
+import json
+import os
+import re
+import statistics
+
+HISTORY_FILE = ".run_test_history.json"
+EMA_ALPHA = 0.5 # weight of the newest runtime
+DEFAULT_RUNTIME_S = 30.0 # no history at all
+# tests expected to be shorter than this are batched into one pool task
+CHUNK_TARGET_S = 10.0
+SIM_RUNTIME_RE = re.compile(r"^Simulation runtime: (\d+)s")
+# watchdog budget is scale * expected runtime + slack (make, copying, elab load)
+WATCHDOG_SLACK_S = 60.0
+MODE_SEP = "#"
+
+def sim_mode(log_wave=False, log_vcd=False, coverage=False, log_kanata=False):
+    """History mode of a suite, "" for plain runs"""
+    flags = (("wave", log_wave), ("vcd", log_vcd), ("cov", coverage),
+             ("kanata", log_kanata))
+    return "+".join(name for name, on in flags if on)
+
+def _key(test_path, repo_root, mode=""):
+    key = os.path.relpath(test_path, repo_root)
+    return f"{key}{MODE_SEP}{mode}" if mode else key
+
+def load(path):
+    if not path or not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Warning: ignoring unreadable runtime history '{path}'")
+        return {}
+
+def update(path, runtimes, repo_root, cycles=None, mode=""):
+    """Fold {test_path: seconds} into the history file at path. cycles is
+    {test_path: simulated cycles}, used to measure the simulation rate"""
+    if not path or not runtimes:
+        return
+    hist = load(path) # re-read, another suite may have written meanwhile
+    for test_path, sec in runtimes.items():
+        key = _key(test_path, repo_root, mode)
+        old = hist.get(key)
+        ema = sec if old is None \
+            else EMA_ALPHA * sec + (1 - EMA_ALPHA) * old["runtime"]
+        hist[key] = {
+            "runtime": round(ema, 2),
+            "last": round(sec, 2),
+            "runs": (old or {}).get("runs", 0) + 1,
+        }
+        if (cycles or {}).get(test_path):
+            hist[key]["cycles"] = cycles[test_path]
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, 'w') as f:
+        json.dump(hist, f, indent=4, sort_keys=True)
+    os.replace(tmp, path)
+
+def _runtime_from_log(test_log):
+    # 'Simulation runtime: Ns' is printed at the very end by run_cfg tcl
+    try:
+        with open(test_log, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            tail = f.read().decode(errors='replace').splitlines()
+    except OSError:
+        return None
+    for line in reversed(tail):
+        m = SIM_RUNTIME_RE.match(line)
+        if m:
+            return float(m.group(1))
+    return None
+
+def expected_runtimes(all_tests, hist, repo_root, log_for_test=None,
+                      mode=""):
+    """{test_path: expected seconds} and the number of tests with real data.
+    Plain runtimes stand in for a mode's missing ones, only the order matters
+    for scheduling"""
+    est, known = {}, 0
+    for t in all_tests:
+        entry = hist.get(_key(t, repo_root, mode)) or \
+            hist.get(_key(t, repo_root))
+        sec = entry["runtime"] if entry else None
+        if sec is None and log_for_test:
+            sec = _runtime_from_log(log_for_test(t))
+        if sec is not None:
+            est[t] = sec
+            known += 1
+
+    fallback = statistics.median(est.values()) if est else DEFAULT_RUNTIME_S
+    for t in all_tests:
+        est.setdefault(t, fallback)
+    return est, known
+
+def schedule(all_tests, est, workers):
+    """Longest-expected-first task list. Long tests get a task each; the tail
+    of short tests is packed into chunks so tiny asm tests don't pay one pool
+    round-trip each, while chunks stay small enough to balance the end"""
+    order = sorted(all_tests, key=lambda t: (-est[t], t))
+    total = sum(est.values())
+    budget = min(CHUNK_TARGET_S, total / max(1, workers * 4))
+
+    tasks, chunk, chunk_s = [], [], 0.0
+    for t in order:
+        if est[t] >= budget:
+            tasks.append([t])
+            continue
+        if chunk and chunk_s + est[t] > budget:
+            tasks.append(chunk)
+            chunk, chunk_s = [], 0.0
+        chunk.append(t)
+        chunk_s += est[t]
+    if chunk:
+        tasks.append(chunk)
+    return tasks
+
+def estimate_makespan(tasks, est, workers):
+    # greedy list scheduling, same as the pool: next task to least loaded worker
+    loads = [0.0] * max(1, min(workers, len(tasks)))
+    for task in tasks:
+        heapq.heappush(loads, heapq.heappop(loads) + sum(est[t] for t in task))
+    return max(loads)
+
+def sim_rate(hist, mode=""):
+    """Median simulated cycles per wall-clock second of mode's runs, None if
+    unknown"""
+    rates = [e["cycles"] / e["last"] for k, e in hist.items()
+             if k.partition(MODE_SEP)[2] == mode
+             and e.get("cycles") and e.get("last")]
+    return statistics.median(rates) if rates else None
+
+def watchdog_budgets(all_tests, hist, repo_root, timeout_clocks, scale,
+                     mode=""):
+    """{test_path: wall-clock seconds before the test counts as hung}, None
+    where there is nothing to base it on. Takes the larger of the history and
+    timeout_clocks based bounds, so a legitimately longer test isn't killed.
+    Only runs of the same mode count, a plain runtime would kill a wave run"""
+    rate = sim_rate(hist, mode)
+    clocks_s = timeout_clocks / rate if rate else None
+    budgets = {}
+    for t in all_tests:
+        entry = hist.get(_key(t, repo_root, mode))
+        bounds = [b for b in (entry and entry["runtime"], clocks_s) if b]
+        budgets[t] = round(scale * max(bounds) + WATCHDOG_SLACK_S) \
+            if bounds and scale > 0 else None
+    return budgets
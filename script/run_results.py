@@ -0,0 +1,121 @@
+"""Per-test result records of a run_test.py run directory
+
+Every simulated test produces one record (status, reason, wall time, cycles,
+instructions, exit code), appended by the suite's parent process as one JSON
+line to RESULTS_FILE in the run dir. The file is append-only: a re-run of a
+test in the same run dir adds a new record and the latest one wins on load, so
+summaries and trend tools read a single file instead of every test.status.
+
+Records also carry the test's inputs (image hash, build key of the snapshot,
+run arguments), so an incremental run can skip tests that passed with
+identical inputs. Each record is tagged with the id of the suite that ran
+it, so a suite can tell its own records from older ones in a kept run dir
+without comparing clocks of the hosts tests ran on.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import uuid
+
+RESULTS_FILE = "results.jsonl"
+# status values, ERROR means the test didn't get to write test.status,
+# TIMEOUT that it was killed by the wall-clock watchdog
+PASSED = "PASSED"
+FAILED = "FAILED"
+ERROR = "ERROR"
+TIMEOUT = "TIMEOUT"
+# siblings of the testlist entry that make up the test image (.mem for the
+# core, .elf for the ISA sim in cosim)
+TEST_IMAGE_EXT = (".mem", ".elf", ".hex", ".bin")
+
+def new_suite_id():
+    return uuid.uuid4().hex[:16]
+
+def make_record(test_path, test_name, status, reason, wall_s, exit_code,
+                tb_status=None, suite=None):
+    """Record dict for one test, tb_status is the parsed test.status, suite
+    the new_suite_id() of the suite that ran it"""
+    tb_status = tb_status or {}
+    def _int(key):
+        try:
+            return int(tb_status[key])
+        except (KeyError, ValueError):
+            return None
+    return {
+        "test": test_name,
+        "path": test_path,
+        "status": status,
+        "reason": reason,
+        "wall_s": round(wall_s, 2),
+        "cycles": _int("cycles"),
+        "instructions": _int("instructions"),
+        "exit_code": exit_code,
+        "finished": datetime.datetime.now().isoformat(timespec='seconds'),
+        "suite": suite,
+    }
+
+def append(run_dir, records):
+    if not records:
+        return
+    # single writer (suite parent), one write per batch of lines
+    with open(os.path.join(run_dir, RESULTS_FILE), 'a') as f:
+        f.write("".join(json.dumps(r, sort_keys=True) + "\n" for r in records))
+
+def load(run_dir):
+    """{test_name: latest record}, empty if the run dir has no results yet"""
+    path = os.path.join(run_dir, RESULTS_FILE)
+    res = {}
+    if not os.path.isfile(path):
+        return res
+    with open(path) as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError: # partial line from an interrupted run
+                continue
+            res[r["test"]] = r
+    return res
+
+# inputs
+def _digest(*values):
+    h = hashlib.sha256()
+    for v in values:
+        h.update(str(v).encode())
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+def _image_digest(test_path):
+    h = hashlib.sha256()
+    base = os.path.splitext(test_path)[0]
+    for ext in TEST_IMAGE_EXT:
+        path = base + ext
+        if not os.path.isfile(path):
+            continue
+        h.update(ext.encode())
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()[:16]
+
+def test_inputs(test_path, snapshot, run_args):
+    """Fingerprint of everything a test run depends on. run_args is anything
+    with a stable str(), e.g. plusarg values and the run cfg"""
+    return {
+        "image": _image_digest(test_path),
+        "snapshot": snapshot[:16],
+        "args": _digest(*run_args),
+    }
+
+def rerun_reason(record, inputs):
+    """Why the test has to run again, None if its last run still holds"""
+    if record is None:
+        return "no previous result"
+    if record["status"] != PASSED:
+        return f"{record['status'].lower()} last time"
+    old = record.get("inputs") or {}
+    changed = [k for k in sorted(inputs) if old.get(k) != inputs[k]]
+    if changed:
+        return "changed " + ", ".join(changed)
+    return None
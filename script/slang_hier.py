@@ -2,14 +2,188 @@
 
 import argparse
 import json
+import re
 import sys
 
 # verilog literal base letter -> int base, for decoding parameter values
 BASES = {"b": 2, "o": 8, "d": 10, "h": 16}
 
+# symbol kinds the hierarchy is built from; everything else (nets, ports,
+# procedural blocks with their statement/expression trees) is skipped unread
+HIER_KINDS = {"Root", "Instance", "InstanceBody", "InstanceArray",
+              "GenerateBlock", "GenerateBlockArray", "Parameter"}
+# symbol keys kept by the streaming loader, beyond body/members
+HIER_KEYS = {"name", "constructIndex", "isLocal", "value"}
+# marker of --save_index files
+INDEX_FORMAT = "slang_hier_index/1"
+
 # one nesting level of plain indentation (default, foldable) output
 INDENT = "    "
 
+class AstStream:
+    """Streaming loader for slang --ast-json output, keeping only what the
+    hierarchy needs: HIER_KINDS symbols with HIER_KEYS, and the name and
+    definitionKind of definitions. Skipped values are scanned over with
+    regexes, never decoded, so memory scales with the hierarchy, not the AST.
+
+    Relies on slang writing 'kind' before a symbol's body/members, which it
+    does for every symbol; were it not, the symbol would be kept whole."""
+
+    CHUNK = 1 << 22
+    WS_RE = re.compile(r"\s*")
+    STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"')
+    SCALAR_RE = re.compile(r"[^\s,}\]]+")
+    # runs of anything but brackets, with strings (that may hold brackets)
+    # consumed whole
+    SKIP_RE = re.compile(r'(?:[^"{}\[\]]+|"(?:[^"\\]|\\.)*")*')
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        # drop the consumed part, append the next chunk
+        data = self.f.read(self.CHUNK)
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        if not data:
+            self.eof = True
+        return bool(data)
+
+    def _peek(self):
+        while True:
+            self.pos = self.WS_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("unexpected end of AST json")
+
+    def _expect(self, c):
+        if self._peek() != c:
+            raise ValueError(f"expected '{c}' at '{self.buf[self.pos:][:40]}'")
+        self.pos += 1
+
+    def _match(self, regex):
+        # match that doesn't end at the buffer end, unless the input did
+        while True:
+            self._peek()
+            m = regex.match(self.buf, self.pos)
+            if m and (m.end() < len(self.buf) or self.eof):
+                self.pos = m.end()
+                return m.group()
+            if not self._fill():
+                if m:
+                    self.pos = m.end()
+                    return m.group()
+                raise ValueError("unexpected end of AST json")
+
+    def _string(self):
+        s = self._match(self.STRING_RE)
+        return s[1:-1] if "\\" not in s else json.loads(s)
+
+    def _close(self, depth, capture=False):
+        """scan to where the enclosing brackets, `depth` of them already
+        open, are closed. Returns the scanned text if capture"""
+        pieces, start = [], self.pos
+        while True:
+            self.pos = self.SKIP_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) and self.buf[self.pos] != '"':
+                depth += 1 if self.buf[self.pos] in "{[" else -1
+                self.pos += 1
+                if depth == 0:
+                    break
+                continue
+            # buffer ends mid-run or mid-string: keep what's done, read more
+            if capture:
+                pieces.append(self.buf[start:self.pos])
+                start = 0
+            if not self._fill():
+                raise ValueError("unexpected end of AST json")
+        if capture:
+            pieces.append(self.buf[start:self.pos])
+            return "".join(pieces)
+        return None
+
+    def _skip(self, capture=False):
+        """skip one value, returns its text if capture"""
+        c = self._peek()
+        if c in "{[":
+            return self._close(0, capture)
+        text = self._match(self.STRING_RE if c == '"' else self.SCALAR_RE)
+        return text if capture else None
+
+    def _object(self, handlers, kinds=None):
+        """handlers: {key: fn() -> value}; other keys are skipped. With kinds,
+        returns None for symbols of any other kind"""
+        obj = {}
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return obj
+        while True:
+            key = self._string()
+            self._expect(":")
+            if key == "kind":
+                obj["kind"] = self._string()
+                if kinds is not None and obj["kind"] not in kinds:
+                    self._close(1) # rest of the object, unread
+                    return None
+            elif key in handlers:
+                obj[key] = handlers[key]()
+            else:
+                self._skip()
+            c = self._peek()
+            self.pos += 1
+            if c == "}":
+                return obj
+            if c != ",":
+                raise ValueError(f"expected ',' or '}}' at '{self.buf[self.pos - 1:][:40]}'")
+
+    def _array(self, item):
+        out = []
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return out
+        while True:
+            v = item()
+            if v is not None:
+                out.append(v)
+            c = self._peek()
+            self.pos += 1
+            if c == "]":
+                return out
+            if c != ",":
+                raise ValueError(f"expected ',' or ']' at '{self.buf[self.pos - 1:][:40]}'")
+
+    def _scalar(self):
+        return json.loads(self._skip(capture=True))
+
+    def _symbol(self):
+        return self._object(self._symbol_handlers, HIER_KINDS)
+
+    def _members(self):
+        return self._array(self._symbol)
+
+    def _definition(self):
+        return self._object({"name": self._string,
+                             "definitionKind": self._string})
+
+    def load(self):
+        self._symbol_handlers = {k: self._scalar for k in HIER_KEYS}
+        self._symbol_handlers.update(body=self._symbol, members=self._members)
+        # {design, definitions} or a bare Root
+        top = dict(self._symbol_handlers, design=self._symbol,
+                   definitions=lambda: self._array(self._definition))
+        return self._object(top)
+
+def load_ast(src, stream=True):
+    """AST dict from an open slang --ast-json file, pruned to the hierarchy
+    when streaming (default) or complete with json.load"""
+    return AstStream(src).load() if stream else json.load(src)
+
 def child_instances(body):
     """Direct child module instances of an InstanceBody. Generate blocks/arrays
     are flattened, but their scope is kept as a Vivado-style prefix on the
@@ -17,37 +191,41 @@ def child_instances(body):
     distinct. Returns [(qualified_inst_name, module_name, child_body), ...]."""
 
     out = []
-
-    def descend(members, scope):
-        for m in members:
-            k = m.get("kind")
-            if k == "Instance":
-                # an Instance carries its elaborated module in .body
-                b = m.get("body", {})
-                out.append((scope + m.get("name"), b.get("name"), b))
-            elif k == "GenerateBlock":
-                # generate-if: qualify by the block label (gen_xxx.); fall back
-                # to [constructIndex] for an unnamed per-iteration block
-                nm, idx = m.get("name"), m.get("constructIndex")
-                if nm:
-                    pre = f"{nm}."
-                elif idx is not None:
-                    pre = f"[{idx}]."
-                else:
-                    pre = ""
-                descend(m.get("members", []), scope + pre)
-            elif k == "GenerateBlockArray":
-                # generate-for: each iteration is an unnamed GenerateBlock under
-                # the array label; qualify as <label>[i].
-                arr = m.get("name")
-                for el in m.get("members", []):
-                    if el.get("kind") == "GenerateBlock":
-                        descend(el.get("members", []),
-                                f"{scope}{arr}[{el.get('constructIndex')}].")
-            elif k == "InstanceArray":
-                descend(m.get("members", []), scope)
-
-    descend(body.get("members", []), "")
+    # explicit stack of (members iterator, scope, generate-for label), so deep
+    # generate nesting doesn't run into the recursion limit
+    stack = [(iter(body.get("members", [])), "", None)]
+    while stack:
+        members, scope, arr = stack[-1]
+        m = next(members, None)
+        if m is None:
+            stack.pop()
+            continue
+        k = m.get("kind")
+        if arr is not None:
+            # generate-for: each iteration is an unnamed GenerateBlock under
+            # the array label; qualify as <label>[i].
+            if k == "GenerateBlock":
+                stack.append((iter(m.get("members", [])),
+                              f"{scope}{arr}[{m.get('constructIndex')}].", None))
+        elif k == "Instance":
+            # an Instance carries its elaborated module in .body
+            b = m.get("body", {})
+            out.append((scope + m.get("name"), b.get("name"), b))
+        elif k == "GenerateBlock":
+            # generate-if: qualify by the block label (gen_xxx.); fall back
+            # to [constructIndex] for an unnamed per-iteration block
+            nm, idx = m.get("name"), m.get("constructIndex")
+            if nm:
+                pre = f"{nm}."
+            elif idx is not None:
+                pre = f"[{idx}]."
+            else:
+                pre = ""
+            stack.append((iter(m.get("members", [])), scope + pre, None))
+        elif k == "GenerateBlockArray":
+            stack.append((iter(m.get("members", [])), scope, m.get("name")))
+        elif k == "InstanceArray":
+            stack.append((iter(m.get("members", [])), scope, None))
     return out
 
 def fmt_param(v):
@@ -73,134 +251,328 @@ def param_str(body):
           if p.get("kind") == "Parameter" and not p.get("isLocal")]
     return ", ".join(f"{n}={v}" for n, v in ps)
 
-def find_root(design, root_name):
-    """Return (instance_name, body) for the requested root (or the elaboration
-    top if root_name is None)."""
+def build_index(ast):
+    """Compact hierarchy of an AST: every distinct subtree once, as
+    nodes[i] = [module, param_str, [[inst_name, child_node], ...]], so the
+    repeats of a generate-for or instance array share one node. Built
+    bottom-up without recursion; JSON-serializable for --save_index."""
+    design = ast.get("design", ast) # tolerate a bare Root too
+    # module definitions, to filter out interfaces; bare Root has none
+    mods = [d["name"] for d in ast.get("definitions", [])
+            if d.get("definitionKind") == "Module"]
     tops = [m for m in design.get("members", []) if m.get("kind") == "Instance"]
+
+    nodes, ids = [], {} # node list, (module, params, children) -> node
+    node_of, kids_of = {}, {} # by id() of the AST body
+    stack = [(t["body"], False) for t in reversed(tops)]
+    while stack:
+        body, ready = stack.pop()
+        if id(body) in node_of:
+            continue
+        if not ready: # children first
+            kids = kids_of[id(body)] = child_instances(body)
+            stack.append((body, True))
+            stack.extend((cb, False) for _, _, cb in reversed(kids))
+            continue
+        children = tuple((iname, node_of[id(cb)])
+                         for iname, _, cb in kids_of.pop(id(body)))
+        key = (body.get("name"), param_str(body), children)
+        if key not in ids:
+            ids[key] = len(nodes)
+            nodes.append([key[0], key[1], [list(c) for c in children]])
+        node_of[id(body)] = ids[key]
+
+    return {
+        "format": INDEX_FORMAT,
+        "modules": mods or None,
+        "tops": [[t["name"], node_of[id(t["body"])]] for t in tops],
+        "nodes": nodes,
+    }
+
+def save_index(index, path):
+    with open(path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+
+def load_index(path):
+    with open(path) as f:
+        index = json.load(f)
+    if not isinstance(index, dict) or index.get("format") != INDEX_FORMAT:
+        sys.exit(f"not a {INDEX_FORMAT} file: {path}")
+    return index
+
+def find_root(index, root_name):
+    """Return (instance_name, node) for the requested root (or the
+    elaboration top if root_name is None)."""
+    tops, nodes = index["tops"], index["nodes"]
     if not tops:
         sys.exit("no top-level instance found in AST")
     if root_name is None:
-        return tops[0]["name"], tops[0]["body"]
-
-    def search(body):
-        for iname, mname, b in child_instances(body):
-            if mname == root_name:
-                return iname, b
-            hit = search(b)
-            if hit:
-                return hit
-        return None
+        return tuple(tops[0])
 
-    for top in tops:
-        if top["body"].get("name") == root_name:
-            return top["name"], top["body"]
-        hit = search(top["body"])
-        if hit:
-            return hit
+    searched = set() # nodes without a match below, skipped when repeated
+    for tname, tnode in tops:
+        if nodes[tnode][0] == root_name:
+            return tname, tnode
+        # pre-order, first match in instantiation order
+        stack = [iter(nodes[tnode][2])]
+        while stack:
+            c = next(stack[-1], None)
+            if c is None:
+                stack.pop()
+                continue
+            iname, n = c
+            if nodes[n][0] == root_name:
+                return iname, n
+            if n not in searched:
+                searched.add(n)
+                stack.append(iter(nodes[n][2]))
     sys.exit(f"root module '{root_name}' not found in hierarchy")
 
-def render(top_body, instances=False, keep=None, params=False, tree=False):
-    """Build the tree lines and the total instance count."""
-    out = []
-    total = [0]
-
-    def visible(kids):
-        # drop interface instances unless filtering is off (keep is None)
-        if keep is None:
-            return kids
-        return [(i, m, b) for (i, m, b) in kids if m in keep]
+def render(index, root, instances=False, keep=None, params=False, tree=False):
+    """Build the tree lines and the total instance count. Walks the index
+    without recursion; subtrees that repeat are generated once."""
+    nodes = index["nodes"]
 
-    def label_of(mname, body):
+    def label_of(n):
         # module name, annotated with its parameters under --params
-        if params:
-            ps = param_str(body)
-            if ps:
-                return f"{mname} ({ps})"
-        return mname
+        mname, ps, _ = nodes[n]
+        return f"{mname} ({ps})" if params and ps else mname
 
-    def walk(label, body, prefix, is_last, top=False):
-        # tree mode draws connectors; indent mode (default) uses plain spaces
-        # so editors can fold the hierarchy by indentation on large designs
-        if top:
-            out.append(label)
-            child_prefix = "" if tree else INDENT
-        elif tree:
-            out.append(prefix + ("└── " if is_last else "├── ") + label)
-            child_prefix = prefix + ("    " if is_last else "│   ")
-        else:
-            out.append(prefix + label)
-            child_prefix = prefix + INDENT
-
-        kids = visible(child_instances(body))
+    def items_of(n):
+        # (label, child node, instances it stands for) per printed child
+        kids = nodes[n][2]
+        if keep is not None:
+            # drop interface instances unless filtering is off (keep is None)
+            kids = [(i, c) for i, c in kids if nodes[c][0] in keep]
         if instances:
             # one line per instance: 'inst (module)'; --params nests the
             # module's own '(params)' -> 'inst (module (params))', matching
             # the collapsed view
-            items = [(f"{cin} ({label_of(cmn, cb)})", cb)
-                     for cin, cmn, cb in kids]
-            total[0] += len(kids)
-        else:
-            # collapse identical siblings; the group key includes the params
-            # under --params, so differing-param instances stay separate
-            order, groups = [], {}
-            for cin, cmn, cb in kids:
-                key = (cmn, param_str(cb)) if params else cmn
-                if key not in groups:
-                    groups[key] = [cmn, cb, 0]
-                    order.append(key)
-                groups[key][2] += 1
-            items = []
-            for key in order:
-                cmn, cb, n = groups[key]
-                total[0] += n
-                lbl = label_of(cmn, cb) + (f"  x{n}" if n > 1 else "")
-                items.append((lbl, cb))
-
-        for i, (lbl, cb) in enumerate(items):
-            walk(lbl, cb, child_prefix, i == len(items) - 1)
-
-    walk(label_of(top_body.get("name"), top_body), top_body, "", True, top=True)
-    return out, total[0]
-
-def render_dot(top_body, keep=None):
+            return [(f"{i} ({label_of(c)})", c, 1) for i, c in kids]
+        # collapse identical siblings; the group key includes the params
+        # under --params, so differing-param instances stay separate
+        order, groups = [], {}
+        for _, c in kids:
+            key = tuple(nodes[c][:2]) if params else nodes[c][0]
+            if key not in groups:
+                groups[key] = [c, 0]
+                order.append(key)
+            groups[key][1] += 1
+        return [(label_of(c) + (f"  x{k}" if k > 1 else ""), c, k)
+                for c, k in (groups[key] for key in order)]
+
+    # children before parents, over the nodes reachable from root
+    items, post = {}, []
+    stack = [(root, False)]
+    while stack:
+        n, ready = stack.pop()
+        if ready:
+            post.append(n)
+        elif n not in items:
+            items[n] = items_of(n)
+            stack.append((n, True))
+            stack.extend((c, False) for _, c, _ in items[n] if c not in items)
+
+    count, refs = {}, {}
+    for n in post:
+        count[n] = sum(k + count[c] for _, c, k in items[n])
+        for _, c, _ in items[n]:
+            refs[c] = refs.get(c, 0) + 1
+
+    def lines_below(n, memo):
+        # tree mode draws connectors; indent mode (default) uses plain spaces
+        # so editors can fold the hierarchy by indentation on large designs
+        out = []
+        frames = [[items[n], 0, ""]] # explicit stack: [items, next, prefix]
+        while frames:
+            f = frames[-1]
+            its, i, prefix = f
+            if i == len(its):
+                frames.pop()
+                continue
+            f[1] += 1
+            lbl, c, _ = its[i]
+            if tree:
+                last = i == len(its) - 1
+                out.append(prefix + ("└── " if last else "├── ") + lbl)
+                child_prefix = prefix + ("    " if last else "│   ")
+            else:
+                out.append(prefix + INDENT + lbl)
+                child_prefix = prefix + INDENT
+            if c in memo:
+                out.extend(child_prefix + line for line in memo[c])
+            else:
+                frames.append([items[c], 0, child_prefix])
+        return out
+
+    # subtrees printed more than once are generated once, innermost first,
+    # and copied in with the prefix of each place they appear
+    memo = {}
+    for n in post:
+        if refs.get(n, 0) > 1 and items[n]:
+            memo[n] = lines_below(n, memo)
+
+    return [label_of(root)] + lines_below(root, memo), count[root]
+
+def render_dot(index, root, keep=None):
     """Graphviz module-dependency graph: one node per module, an edge per
     'parent instantiates child' (labelled xN when instantiated more than once).
     Containment/block view, not net-level connectivity."""
-    nodes = [] # unique module names, first-seen order
+    nodes = index["nodes"]
+    names = [nodes[root][0]] # unique module names, first-seen order
     edges = {} # (parent, child) -> instance count
-    seen = set() # modules already expanded (DAG: expand each once)
-
-    def visit(mname, body):
-        if mname not in seen:
-            seen.add(mname)
-            nodes.append(mname)
-        kids = child_instances(body)
-        if keep is not None:
-            kids = [(i, m, b) for (i, m, b) in kids if m in keep]
+    seen = set(names) # modules already expanded (DAG: expand each once)
 
-        order, bodies, cnt = [], {}, {}
-        for _, cmn, cb in kids:
+    def groups(n):
+        # (child module, first node of it, count) in instantiation order
+        order, first, cnt = [], {}, {}
+        for _, c in nodes[n][2]:
+            cmn = nodes[c][0]
+            if keep is not None and cmn not in keep:
+                continue
             if cmn not in cnt:
                 order.append(cmn)
-                bodies[cmn] = cb
+                first[cmn] = c
                 cnt[cmn] = 0
             cnt[cmn] += 1
+        return iter([(cmn, first[cmn], cnt[cmn]) for cmn in order])
 
-        for cmn in order:
-            # record the edge before recursing so multi-parent edges all land
-            edges[(mname, cmn)] = edges.get((mname, cmn), 0) + cnt[cmn]
-            if cmn not in seen:
-                visit(cmn, bodies[cmn])
+    stack = [(nodes[root][0], groups(root))]
+    while stack:
+        mname, it = stack[-1]
+        g = next(it, None)
+        if g is None:
+            stack.pop()
+            continue
+        cmn, c, k = g
+        # record the edge before descending so multi-parent edges all land
+        edges[(mname, cmn)] = edges.get((mname, cmn), 0) + k
+        if cmn not in seen:
+            seen.add(cmn)
+            names.append(cmn)
+            stack.append((cmn, groups(c)))
 
-    visit(top_body.get("name"), top_body)
     out = ["digraph hier {", "  rankdir=LR;", "  node [shape=box];"]
-    out += [f'  "{n}";' for n in nodes]
+    out += [f'  "{n}";' for n in names]
     for (p, c), n in edges.items():
         lbl = f' [label="x{n}"]' if n > 1 else ""
         out.append(f'  "{p}" -> "{c}"{lbl};')
     out.append("}")
     return out
 
+# queries
+def _kids(index, n, keep):
+    kids = index["nodes"][n][2]
+    if keep is None:
+        return kids
+    return [(i, c) for i, c in kids if index["nodes"][c][0] in keep]
+
+def _post_order(index, root, keep):
+    # children before parents, over the nodes reachable from root
+    post, seen = [], set()
+    stack = [(root, False)]
+    while stack:
+        n, ready = stack.pop()
+        if ready:
+            post.append(n)
+        elif n not in seen:
+            seen.add(n)
+            stack.append((n, True))
+            stack.extend((c, False) for _, c in _kids(index, n, keep)
+                         if c not in seen)
+    return post
+
+def glob_re(pattern):
+    """instance path glob: '*' within one path level, '**' across levels,
+    '?' one char; brackets are literal, as in gen_arr[3].u_inst"""
+    out = []
+    for tok in re.split(r"(\*\*|\*|\?)", pattern):
+        out.append({"**": ".*", "*": r"[^.]*", "?": r"[^.]"}.get(
+            tok, re.escape(tok)))
+    return re.compile("".join(out) + "$")
+
+def find_paths(index, root, pattern, keep=None):
+    """[(path, node)] of instances below root whose dotted path (relative to
+    root, generate scopes included) matches the glob pattern"""
+    rx = glob_re(pattern)
+    out = []
+    stack = [(iter(_kids(index, root, keep)), "")]
+    while stack:
+        it, prefix = stack[-1]
+        c = next(it, None)
+        if c is None:
+            stack.pop()
+            continue
+        path = prefix + c[0]
+        if rx.match(path):
+            out.append((path, c[1]))
+        stack.append((iter(_kids(index, c[1], keep)), path + "."))
+    return out
+
+def module_counts(index, root, keep=None):
+    """{module: instances} below root (root itself excluded, as in render's
+    total), from how many times each node is instantiated, without expanding
+    the hierarchy"""
+    post = _post_order(index, root, keep)
+    mult = {root: 1}
+    for n in reversed(post): # parents first
+        for _, c in _kids(index, n, keep):
+            mult[c] = mult.get(c, 0) + mult[n]
+    counts = {}
+    for n in post:
+        if n == root:
+            continue
+        mname = index["nodes"][n][0]
+        counts[mname] = counts.get(mname, 0) + mult[n]
+    return dict(sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])))
+
+def diff(a, a_root, b, b_root, keep=None):
+    """Structural diff of two indexes below their roots, as lists of
+    (path, node) removed from a, added in b, and (path, a node, b node) of
+    instances whose module or parameters changed. Identical subtrees are
+    matched in one step, so the cost follows the size of the change."""
+    canon, ids = {}, {} # (side, node) -> id shared by identical subtrees
+    for side, index, root in (("a", a, a_root), ("b", b, b_root)):
+        for n in _post_order(index, root, keep):
+            mname, ps, _ = index["nodes"][n]
+            key = (mname, ps, tuple((i, canon[side, c])
+                                    for i, c in _kids(index, n, keep)))
+            canon[side, n] = ids.setdefault(key, len(ids))
+
+    removed, added, changed = [], [], []
+    stack = [(a_root, b_root, "")]
+    while stack:
+        na, nb, prefix = stack.pop()
+        if canon["a", na] == canon["b", nb]:
+            continue
+        kb = dict(_kids(b, nb, keep))
+        ka = dict(_kids(a, na, keep))
+        for inst, ca in _kids(a, na, keep):
+            if inst not in kb:
+                removed.append((prefix + inst, ca))
+        for inst, cb in _kids(b, nb, keep):
+            path = prefix + inst
+            if inst not in ka:
+                added.append((path, cb))
+                continue
+            ca = ka[inst]
+            if a["nodes"][ca][:2] != b["nodes"][cb][:2]:
+                changed.append((path, ca, cb))
+                if a["nodes"][ca][0] != b["nodes"][cb][0]:
+                    continue # another module, its insides aren't comparable
+            stack.append((ca, cb, path + "."))
+    return sorted(removed), sorted(added), sorted(changed)
+
+def load_input(path, stream=True):
+    """index of an AST file, or of a saved index file"""
+    with open(path) as f:
+        saved = f.read(len(INDEX_FORMAT) + 16).startswith(
+            f'{{"format":"{INDEX_FORMAT}"')
+    if saved:
+        return load_index(path)
+    with open(path) as f:
+        return build_index(load_ast(f, stream=stream))
+
 def parse_args():
     parser = argparse.ArgumentParser(
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -208,46 +580,140 @@ def parse_args():
         epilog=(
             "examples:\n"
             "  slang ... --top <top> --ast-json - | slang_hier.py [opts]\n"
-            "  slang_hier.py ast.json --params --tree")
+            "  slang_hier.py ast.json --params --tree\n"
+            "  slang_hier.py ast.json --save_index hier.idx\n"
+            "  slang_hier.py --index hier.idx --root MODULE --dot\n"
+            "  slang_hier.py ast.json --find 'core.**.u_alu' --params\n"
+            "  slang_hier.py ast.json --counts --json\n"
+            "  slang_hier.py new.json --diff old.json\n"
+            "  make hier HIER_ARGS='--counts --json'")
         )
-    parser.add_argument("ast", nargs="?", help="AST json file; reads stdin if omitted")
+    parser.add_argument("ast", nargs="?", help="AST json file or saved index; reads an AST from stdin if omitted")
     parser.add_argument("--root", metavar="MODULE", help="start the tree at the first instance of MODULE (default: elaboration top)")
     parser.add_argument("--instances", action="store_true", help="list every instance, no collapsing")
     parser.add_argument("--params", action="store_true", help="annotate modules with parameter values (differing-param instances stay separate when collapsed)")
     parser.add_argument("--interfaces", action="store_true", help="include SV interface instances (default: modules only)")
     parser.add_argument("--tree", action="store_true", help="box-drawing connectors instead of the default plain indentation")
-    parser.add_argument("--dot", action="store_true", help="emit a Graphviz module-dependency graph instead of a text tree")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--dot", action="store_true", help="emit a Graphviz module-dependency graph instead of a text tree")
+    mode.add_argument("--find", metavar="GLOB", help="list instances whose path below the root matches GLOB ('*' within a level, '**' across levels, brackets literal)")
+    mode.add_argument("--counts", action="store_true", help="total instances per module below the root")
+    mode.add_argument("--diff", metavar="OTHER", help="structural diff against another AST or saved index (OTHER as old, this as new): instances removed, added, and with a changed module or parameters, plus module count changes")
+    parser.add_argument("--json", action="store_true", help="machine-readable output for --find, --counts and --diff")
+    parser.add_argument("--index", metavar="FILE", help="read a hierarchy index saved with --save_index instead of an AST")
+    parser.add_argument("--save_index", metavar="FILE", help="save the hierarchy index of the AST to FILE, for later queries without re-parsing")
+    parser.add_argument("--no_stream", action="store_true", help="json.load the whole AST instead of streaming only the hierarchy out of it (uses several times the dump size in memory)")
     args = parser.parse_args()
 
     # no file and stdin is a terminal -> json.load would block forever; bail
-    if args.ast is None and sys.stdin.isatty():
+    if args.ast is not None and args.index:
+        parser.error("give either an AST or --index, not both")
+    if args.json and not (args.find or args.counts or args.diff):
+        parser.error("--json needs one of --find, --counts, --diff")
+    if args.ast is None and not args.index and sys.stdin.isatty():
         parser.error("no input: give an AST file or pipe 'slang --ast-json -'")
     return args
 
 def main():
     args = parse_args()
-    src = open(args.ast) if args.ast else sys.stdin
-    ast = json.load(src)
-    design = ast.get("design", ast) # tolerate a bare Root too
+    if args.index:
+        index = load_index(args.index)
+    elif args.ast:
+        index = load_input(args.ast, stream=not args.no_stream)
+    else:
+        index = build_index(load_ast(sys.stdin, stream=not args.no_stream))
+    if args.save_index:
+        save_index(index, args.save_index)
 
     keep = None
-    if not args.interfaces:
+    if not args.interfaces and index["modules"]:
         # restrict to module instances; interfaces are a separate definitionKind
-        mods = {d["name"] for d in ast.get("definitions", [])
-                if d.get("definitionKind") == "Module"}
-        keep = mods or None # bare Root has no defs -> can't filter, show all
+        # (bare Root has no defs -> can't filter, show all)
+        keep = set(index["modules"])
 
-    _, body = find_root(design, args.root)
+    _, root = find_root(index, args.root)
+    if args.find or args.counts or args.diff:
+        query(args, index, root, keep)
+        return
     if args.dot:
-        print("\n".join(render_dot(body, keep=keep)))
+        print("\n".join(render_dot(index, root, keep=keep)))
         return
     lines, total = render(
-        body, instances=args.instances, keep=keep, params=args.params,
+        index, root, instances=args.instances, keep=keep, params=args.params,
         tree=args.tree
     )
     print("\n".join(lines))
     kind = "instances" if args.instances else "instances (collapsed)"
     print(f"\n{total} {kind}")
 
+def query(args, index, root, keep):
+    nodes = index["nodes"]
+    def desc(node, nodes=nodes):
+        mname, ps, _ = nodes[node]
+        return {"module": mname, "params": ps}
+    def label(d):
+        return f"{d['module']} ({d['params']})" \
+            if args.params and d["params"] else d["module"]
+
+    if args.find:
+        res = [{"path": p, **desc(n)}
+               for p, n in find_paths(index, root, args.find, keep)]
+        if args.json:
+            print(json.dumps(res, indent=2))
+            return
+        for r in res:
+            print(f"{r['path']} ({label(r)})")
+        print(f"\n{len(res)} matching instances")
+        return
+
+    if args.counts:
+        counts = module_counts(index, root, keep)
+        if args.json:
+            print(json.dumps({"root": nodes[root][0], "counts": counts,
+                              "total": sum(counts.values())}, indent=2))
+            return
+        w = max(map(len, counts))
+        for mname, n in counts.items():
+            print(f"{mname:<{w}}  {n}")
+        print(f"\n{sum(counts.values())} instances")
+        return
+
+    old = load_input(args.diff, stream=not args.no_stream)
+    _, old_root = find_root(old, args.root)
+    removed, added, changed = diff(old, old_root, index, root, keep)
+    cnt_old = module_counts(old, old_root, keep)
+    cnt_new = module_counts(index, root, keep)
+    cnt = {m: [cnt_old.get(m, 0), cnt_new.get(m, 0)]
+           for m in sorted(set(cnt_old) | set(cnt_new))
+           if cnt_old.get(m, 0) != cnt_new.get(m, 0)}
+    def sub_count(idx, node): # the instance and everything below it
+        return 1 + sum(module_counts(idx, node, keep).values())
+    res = {
+        "removed": [{"path": p, **desc(n, old["nodes"]),
+                     "instances": sub_count(old, n)} for p, n in removed],
+        "added": [{"path": p, **desc(n), "instances": sub_count(index, n)}
+                  for p, n in added],
+        "changed": [{"path": p, "old": desc(a, old["nodes"]), "new": desc(b)}
+                    for p, a, b in changed],
+        "counts": cnt,
+    }
+    if args.json:
+        print(json.dumps(res, indent=2))
+        return
+    for r in res["removed"]:
+        print(f"- {r['path']} ({label(r)}), {r['instances']} instances")
+    for r in res["added"]:
+        print(f"+ {r['path']} ({label(r)}), {r['instances']} instances")
+    for r in res["changed"]: # params always shown, they're often the change
+        print(f"~ {r['path']}: {r['old']['module']} ({r['old']['params']})"
+              f" -> {r['new']['module']} ({r['new']['params']})")
+    if cnt:
+        print("\nmodule counts (old -> new):")
+        w = max(map(len, cnt))
+        for mname, (o, n) in cnt.items():
+            print(f"{INDENT}{mname:<{w}}  {o} -> {n} ({n - o:+d})")
+    elif not (removed or added or changed):
+        print("no structural differences")
+
 if __name__ == "__main__":
     main()
@@ -1,4 +1,5 @@
 import datetime
+import os
 
 CC_RED = "91m"
 CC_YELLOW = "93m"
@@ -24,3 +25,19 @@ def print_runtime(start_time, process_name='', guard_char=''):
         end="\n",
         sep=''
     )
+
+def get_dir_size(path):
+    # apparent size of regular files under path, symlinks not followed
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for fn in filenames:
+            fp = os.path.join(dirpath, fn)
+            if not os.path.islink(fp):
+                total += os.path.getsize(fp)
+    return total
+
+def format_bytes(num):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num) < 1024 or unit == "GB":
+            return f"{num:.0f}{unit}" if unit == "B" else f"{num:.1f}{unit}"
+        num /= 1024
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Parsers for the Vivado text reports written by fpga/synt.tcl, and a QoR
+(quality of results) database across run dirs
+
+Reports are streamed line by line and only the summary numbers are kept:
+WNS/TNS and per-clock Fmax from report_timing_summary, Used/Util% of the main
+resources from report_utilization, on-chip power from report_power, reuse of
+incremental runs from report_incremental_reuse and per-command runtimes from
+the vivado log. Anything missing comes back as None,
+e.g. for a run that died before writing its reports.
+
+Each run dir gets a qor.json, and one JSON line per run is appended to the QoR
+database, so comparing many runs is a query instead of grepping report trees:
+
+    vivado_reports.py parse synt_*/            # (re)index existing run dirs
+    vivado_reports.py query -n simd --sort wns # table of matching runs
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import re
+import sys
+
+QOR_FILE = "qor.json" # per run dir
+QOR_DB = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ".run_synt_qor.jsonl")
+
+# report_utilization row names, synthesis marks estimates with a trailing '*'
+UTIL_ROWS = {
+    "Slice LUTs": "luts",
+    "Slice Registers": "ffs",
+    "Block RAM Tile": "bram",
+    "DSPs": "dsp",
+}
+UTIL_ROW_RE = re.compile(
+    r"^\|\s*(?P<name>[A-Za-z ]+?)\*?\s*\|\s*(?P<used>[\d.]+)\s*\|"
+    r"(?:[^|]*\|){3}\s*(?P<util>[\d.<]+)\s*\|")
+POWER_ROWS = {
+    "Total On-Chip Power (W)": "total_w",
+    "Dynamic (W)": "dynamic_w",
+    "Device Static (W)": "static_w",
+}
+POWER_ROW_RE = re.compile(r"^\|\s*(?P<name>[^|]+?)\s*\|\s*(?P<val>[\d.]+)")
+# '| Cells | 99.81 | 99.50 | 0.00 | 20117 |', Matched/Reuse/Fixed % then Total
+REUSE_ROW_RE = re.compile(
+    r"^\|\s*(?P<type>Cells|Nets|Pins|Ports)\s*\|[^|]*\|\s*(?P<reuse>[\d.]+)\s*\|")
+SECTION_RE = re.compile(r"^\|\s*(?P<title>\w[\w ]*\w)\s*$")
+CLOCK_SUMMARY_RE = re.compile(
+    r"^\s*(?P<name>\S+)\s+\{[^}]*\}\s+(?P<period>[\d.]+)\s+[\d.]+")
+CLOCK_WNS_RE = re.compile(r"^\s*(?P<name>\S+)\s+(?P<wns>-?[\d.]+)\s+-?[\d.]+")
+# '<cmd>: Time (s): cpu = 00:01:02 ; elapsed = 00:00:40 . Memory (MB): peak = ..'
+STAGE_RE = re.compile(
+    r"^(?P<cmd>\w+): Time \(s\): cpu = (?P<cpu>[\d:]+) ; "
+    r"elapsed = (?P<elapsed>[\d:]+) \. Memory \(MB\): peak = (?P<peak>[\d.]+)")
+
+# per-report parsers
+def _lines(path):
+    if not os.path.isfile(path):
+        return
+    with open(path, errors='replace') as f:
+        yield from f
+
+def parse_timing_summary(path):
+    """{'wns': ns, 'tns': ns, 'fmax_mhz': MHz, 'clocks': {name: {...}}}.
+    fmax_mhz is that of the clock with the worst WNS, 1000 / (period - WNS)"""
+    res = {"wns": None, "tns": None, "fmax_mhz": None, "clocks": {}}
+    section, header_seen = None, False
+    periods, clock_wns = {}, {}
+    for line in _lines(path):
+        m = SECTION_RE.match(line)
+        if m:
+            section, header_seen = m.group("title"), False
+            continue
+        if section == "Design Timing Summary":
+            # header, dashes, then the values row
+            if line.strip().startswith("WNS(ns)"):
+                header_seen = True
+            elif header_seen and not set(line.strip()) <= set("- "):
+                # values start with '-' on failing timing, only skip the
+                # dashes line
+                vals = line.split()
+                try:
+                    res["wns"], res["tns"] = float(vals[0]), float(vals[1])
+                except (ValueError, IndexError):
+                    pass
+                header_seen = False
+        elif section == "Clock Summary":
+            m = CLOCK_SUMMARY_RE.match(line)
+            if m:
+                periods[m.group("name")] = float(m.group("period"))
+        elif section == "Intra Clock Table":
+            m = CLOCK_WNS_RE.match(line)
+            if m:
+                clock_wns[m.group("name")] = float(m.group("wns"))
+
+    for name, wns in clock_wns.items():
+        period = periods.get(name)
+        fmax = round(1000 / (period - wns), 2) \
+            if period and period - wns > 0 else None
+        res["clocks"][name] = {
+            "period_ns": period, "wns": wns, "fmax_mhz": fmax}
+    if clock_wns:
+        worst = min(clock_wns, key=clock_wns.get)
+        res["fmax_mhz"] = res["clocks"][worst]["fmax_mhz"]
+    return res
+
+def parse_utilization(path):
+    """{'luts': used, 'luts_pct': util%, ...} for UTIL_ROWS"""
+    res = {}
+    for key in UTIL_ROWS.values():
+        res[key], res[f"{key}_pct"] = None, None
+    for line in _lines(path):
+        m = UTIL_ROW_RE.match(line)
+        if not m or m.group("name") not in UTIL_ROWS:
+            continue
+        key = UTIL_ROWS[m.group("name")]
+        if res[key] is not None: # first table has the totals
+            continue
+        res[key] = float(m.group("used"))
+        res[f"{key}_pct"] = float(m.group("util").lstrip("<"))
+    return res
+
+def parse_power(path):
+    """{'total_w', 'dynamic_w', 'static_w'} from the report_power summary"""
+    res = dict.fromkeys(POWER_ROWS.values())
+    for line in _lines(path):
+        m = POWER_ROW_RE.match(line)
+        if not m or m.group("name") not in POWER_ROWS:
+            continue
+        key = POWER_ROWS[m.group("name")]
+        if res[key] is None: # summary table comes first
+            res[key] = float(m.group("val"))
+    return res
+
+def parse_incremental_reuse(path):
+    """{'cells_pct', 'nets_pct', 'pins_pct', 'ports_pct'} reused from the
+    reference checkpoint, all None for non-incremental runs"""
+    res = dict.fromkeys(("cells_pct", "nets_pct", "pins_pct", "ports_pct"))
+    for line in _lines(path):
+        m = REUSE_ROW_RE.match(line)
+        if not m:
+            continue
+        key = f"{m.group('type').lower()}_pct"
+        if res[key] is None: # reuse summary comes first
+            res[key] = float(m.group("reuse"))
+    return res
+
+def _hms_to_s(hms):
+    s = 0
+    for part in hms.split(":"):
+        s = s * 60 + int(part)
+    return s
+
+def parse_stage_runtimes(path):
+    """{vivado command: {'elapsed_s', 'cpu_s', 'peak_mb'}} from the vivado log,
+    repeated commands (e.g. phys_opt_design passes) are summed"""
+    res = {}
+    for line in _lines(path):
+        m = STAGE_RE.match(line)
+        if not m:
+            continue
+        st = res.setdefault(
+            m.group("cmd"), {"elapsed_s": 0, "cpu_s": 0, "peak_mb": 0.0})
+        st["elapsed_s"] += _hms_to_s(m.group("elapsed"))
+        st["cpu_s"] += _hms_to_s(m.group("cpu"))
+        st["peak_mb"] = max(st["peak_mb"], float(m.group("peak")))
+    return res
+
+# per run
+def collect_run(run_dir):
+    """everything known about one fpga/synt.tcl run dir"""
+    def rpt(name):
+        return os.path.join(run_dir, name)
+    return {
+        "timing_synt":
+            parse_timing_summary(rpt("timing_summary_synt.max.rpt")),
+        "timing_routed":
+            parse_timing_summary(rpt("timing_summary_routed.max.rpt")),
+        "util_synt": parse_utilization(rpt("util_synt.rpt")),
+        "util_routed": parse_utilization(rpt("util_routed.rpt")),
+        "power": parse_power(rpt("power_routed.rpt")),
+        "reuse": parse_incremental_reuse(rpt("incr_reuse.rpt")),
+        "stages": parse_stage_runtimes(rpt("run.log")),
+    }
+
+def flatten(qor):
+    """one flat row of the headline numbers, as used for tables and CSVs"""
+    row = {
+        "wns_synt": qor["timing_synt"]["wns"],
+        "wns": qor["timing_routed"]["wns"],
+        "tns": qor["timing_routed"]["tns"],
+        "fmax_mhz": qor["timing_routed"]["fmax_mhz"],
+    }
+    row.update(qor["util_routed"])
+    row["power_w"] = qor["power"]["total_w"]
+    reuse = qor.get("reuse") or {} # records from before incremental runs
+    row["reuse_cells_pct"] = reuse.get("cells_pct")
+    row["reuse_nets_pct"] = reuse.get("nets_pct")
+    row["runtime_s"] = sum(s["elapsed_s"] for s in qor["stages"].values()) \
+        or None
+    return row
+
+def write_run(run_dir, name=None, rc=None, extra=None, db=QOR_DB):
+    """collect run_dir into its qor.json and append it to the QoR database"""
+    qor = {
+        "name": name or os.path.basename(os.path.normpath(run_dir)),
+        "run_dir": os.path.abspath(run_dir),
+        "recorded": datetime.datetime.now().isoformat(timespec='seconds'),
+        "rc": rc,
+        **(extra or {}),
+        **collect_run(run_dir),
+    }
+    with open(os.path.join(run_dir, QOR_FILE), "w") as f:
+        json.dump(qor, f, indent=4)
+    if db:
+        with open(db, "a") as f:
+            f.write(json.dumps(qor, sort_keys=True) + "\n")
+    return qor
+
+# database
+def load_db(db=QOR_DB):
+    """latest record per run dir"""
+    res = {}
+    for line in _lines(db):
+        try:
+            r = json.loads(line)
+        except ValueError: # partial line from an interrupted write
+            continue
+        res[r["run_dir"]] = r
+    return list(res.values())
+
+def query(records, name_re=None, sort=None, reverse=False):
+    """flat rows of records whose name matches name_re, sorted by a column"""
+    rows = []
+    for r in records:
+        if name_re and not re.search(name_re, r["name"]):
+            continue
+        rows.append({"name": r["name"], "recorded": r["recorded"],
+                     "rc": r.get("rc"), **flatten(r),
+                     "run_dir": r["run_dir"]})
+    if sort:
+        # runs without the value last, whichever the order
+        present = [r for r in rows if r.get(sort) is not None]
+        missing = [r for r in rows if r.get(sort) is None]
+        rows = sorted(present, key=lambda r: r[sort], reverse=reverse) + \
+            missing
+    return rows
+
+def print_table(rows, fields):
+    if not rows:
+        print("no matching runs")
+        return
+    cells = [[f for f in fields]] + [
+        ["-" if r.get(f) is None else str(r.get(f)) for f in fields]
+        for r in rows
+    ]
+    widths = [max(len(c[i]) for c in cells) for i in range(len(fields))]
+    for c in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(c, widths)).rstrip())
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Vivado report parser and cross-run QoR database")
+    parser.add_argument("--db", default=QOR_DB, help=f"QoR database (default: {QOR_DB})")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("parse", help="Parse run dirs, write their qor.json and add them to the database")
+    p.add_argument("run_dirs", nargs="+", help="fpga/synt.tcl run dirs")
+    q = sub.add_parser("query", help="Print or export runs from the database")
+    q.add_argument("-n", "--name", help="Regex on run names")
+    q.add_argument("-s", "--sort", default="recorded", help="Column to sort by (default: recorded)")
+    q.add_argument("-r", "--reverse", action="store_true", help="Descending sort")
+    q.add_argument("-f", "--fields", nargs="+", default=["name", "wns", "tns", "fmax_mhz", "luts", "ffs", "bram", "dsp", "power_w", "runtime_s"], help="Columns to print")
+    q.add_argument("--csv", metavar="FILE", help="Write all columns of the matching runs to FILE")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.cmd == "parse":
+        for rd in args.run_dirs:
+            if not os.path.isdir(rd):
+                sys.exit(f"error: not a directory: {rd}")
+            row = flatten(write_run(rd, db=args.db))
+            print(f"{rd}: WNS {row['wns']}ns, Fmax {row['fmax_mhz']}MHz, " +
+                  f"{row['luts']} LUTs")
+        return
+
+    rows = query(load_db(args.db), args.name, args.sort, args.reverse)
+    print_table(rows, args.fields)
+    if args.csv and rows:
+        with open(args.csv, "w", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=list(rows[0]))
+            w.writeheader()
+            w.writerows(rows)
+
+if __name__ == "__main__":
+    main()
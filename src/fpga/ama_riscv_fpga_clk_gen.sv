@@ -23,6 +23,13 @@ logic clk_gen_pll_lock;
 localparam CLOCK_FREQ_IN = 100; // MHz
 localparam real CLOCK_PERIOD_IN = (1000.0 / CLOCK_FREQ_IN); // 10 ns
 localparam longint CLKIN1 = (CLOCK_FREQ_IN * 1_000_000); // Hz
+
+`ifdef FPGA_CLKFBOUT_MULT
+// solved for the target freq (script/artix_7_pll_config.py), e.g. by sweeps
+localparam DIVCLK_DIVIDE = `FPGA_DIVCLK_DIVIDE;
+localparam CLKFBOUT_MULT = `FPGA_CLKFBOUT_MULT;
+localparam CLKOUT0_DIVIDE = `FPGA_CLKOUT0_DIVIDE;
+`else
 localparam DIVCLK_DIVIDE = 1;
 
 // PLL config per target freq; vco = CLKIN1 * CLKFBOUT_MULT / DIVCLK_DIVIDE
@@ -49,6 +56,7 @@ localparam CLKOUT0_DIVIDE =
     (CPU_TARGET_FREQ_MHZ == 90)  ? 10 :
     (CPU_TARGET_FREQ_MHZ == 100) ? 15 :
     0;
+`endif
 
 if (CLKFBOUT_MULT == 0) begin: check_target_freq
     $error("unsupported CPU_TARGET_FREQ_MHZ for BOARD_ARTY_A7");
@@ -86,6 +94,13 @@ PLLE2_ADV #(
 localparam CLOCK_FREQ_IN = 12; // MHz
 localparam real CLOCK_PERIOD_IN = (1000.0 / CLOCK_FREQ_IN); // 83.333 ns
 localparam longint CLKIN1 = (CLOCK_FREQ_IN * 1_000_000); // Hz
+
+`ifdef FPGA_CLKFBOUT_MULT
+// solved for the target freq (script/artix_7_pll_config.py), e.g. by sweeps
+localparam DIVCLK_DIVIDE = `FPGA_DIVCLK_DIVIDE;
+localparam real CLKFBOUT_MULT_F = `FPGA_CLKFBOUT_MULT;
+localparam real CLKOUT0_DIVIDE_F = `FPGA_CLKOUT0_DIVIDE;
+`else
 localparam DIVCLK_DIVIDE = 1;
 
 // MMCM config per target freq; vco = CLKIN1 * CLKFBOUT_MULT_F / DIVCLK_DIVIDE
@@ -100,6 +115,7 @@ localparam real CLKOUT0_DIVIDE_F =
     (CPU_TARGET_FREQ_MHZ == 55) ? 12.0 :
     (CPU_TARGET_FREQ_MHZ == 60) ? 12.0 :
     0.0;
+`endif
 
 if (CLKFBOUT_MULT_F == 0.0) begin: check_target_freq
     $error("unsupported CPU_TARGET_FREQ_MHZ for BOARD_CMOD_A7");
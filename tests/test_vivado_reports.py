@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "script"))
+
+import vivado_reports
+
+TIMING_SUMMARY = """\
+------------------------------------------------------------------------------------------------
+| Design Timing Summary
+| ---------------------
+------------------------------------------------------------------------------------------------
+
+    WNS(ns)      TNS(ns)  TNS Failing Endpoints  TNS Total Endpoints      WHS(ns)      THS(ns)
+    -------      -------  ---------------------  -------------------      -------      -------
+    {wns:>7}  {tns:>11}                     42                 9000        0.051        0.000
+
+
+------------------------------------------------------------------------------------------------
+| Clock Summary
+| -------------
+------------------------------------------------------------------------------------------------
+
+Clock       Waveform(ns)         Period(ns)      Frequency(MHz)
+-----       ------------         ----------      --------------
+clk_pin     {{0.000 5.000}}        10.000          100.000
+
+
+------------------------------------------------------------------------------------------------
+| Intra Clock Table
+| -----------------
+------------------------------------------------------------------------------------------------
+
+Clock             WNS(ns)      TNS(ns)  TNS Failing Endpoints  TNS Total Endpoints
+-----             -------      -------  ---------------------  -------------------
+clk_pin           {wns:>7}  {tns:>11}                     42                 9000
+"""
+
+def _timing(tmp_path, wns, tns):
+    path = tmp_path / "timing_summary_routed.max.rpt"
+    path.write_text(TIMING_SUMMARY.format(wns=wns, tns=tns))
+    return vivado_reports.parse_timing_summary(str(path))
+
+def test_timing_summary_met(tmp_path):
+    res = _timing(tmp_path, "0.500", "0.000")
+    assert (res["wns"], res["tns"]) == (0.5, 0.0)
+    assert res["fmax_mhz"] == round(1000 / 9.5, 2)
+
+def test_timing_summary_negative_slack(tmp_path):
+    res = _timing(tmp_path, "-2.000", "-10.000")
+    assert (res["wns"], res["tns"]) == (-2.0, -10.0)
+    assert res["clocks"]["clk_pin"]["wns"] == -2.0
+    assert res["fmax_mhz"] == round(1000 / 12.0, 2)
+
+def test_timing_summary_missing(tmp_path):
+    res = vivado_reports.parse_timing_summary(str(tmp_path / "none.rpt"))
+    assert res["wns"] is None and res["fmax_mhz"] is None